@@ -0,0 +1,288 @@
+import httpx
+import logging
+import asyncio
+import time
+import os
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Dict, Any, Optional
+from dotenv import load_dotenv
+from models import CodeExecutionResult
+
+load_dotenv()
+
+api_url = os.getenv('COMPILER_API_ENDPOINT')
+
+# Judge0 rejects batches larger than MAX_SUBMISSION_BATCH_SIZE (20 by default)
+JUDGE0_BATCH_SIZE = int(os.getenv('JUDGE0_BATCH_SIZE', '20'))
+JUDGE0_POLL_INITIAL_DELAY = float(os.getenv('JUDGE0_POLL_INITIAL_DELAY', '0.2'))
+JUDGE0_POLL_MAX_DELAY = float(os.getenv('JUDGE0_POLL_MAX_DELAY', '2.0'))
+JUDGE0_POLL_TIMEOUT = float(os.getenv('JUDGE0_POLL_TIMEOUT', '60'))
+
+# Connection pool settings for the shared Judge0 client
+JUDGE0_MAX_CONNECTIONS = int(os.getenv('JUDGE0_MAX_CONNECTIONS', '100'))
+JUDGE0_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('JUDGE0_MAX_KEEPALIVE_CONNECTIONS', '20'))
+JUDGE0_KEEPALIVE_EXPIRY = float(os.getenv('JUDGE0_KEEPALIVE_EXPIRY', '30'))
+JUDGE0_HTTP2 = os.getenv('JUDGE0_HTTP2', 'false').lower() == 'true'
+
+# Judge0 status ids 1 (In Queue) and 2 (Processing) mean the submission has not finished yet
+PENDING_STATUS_IDS = {1, 2}
+SUBMISSION_FIELDS = "token,stdout,stderr,compile_output,time,memory,status"
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE_IDS = {
+    "python": 71,
+    "cpp": 54,
+    "c": 50,
+    "javascript": 63,
+    "java": 62,
+    "ruby": 72,
+    "rust": 73,
+    "r": 80,
+    "go": 60,
+    "swift": 83,
+    "typescript": 74,
+    "php": 68,
+}
+
+# Called with (input index, result) as results arrive; returning True stops the remaining runs
+StopCondition = Callable[[int, CodeExecutionResult], bool]
+
+def empty_result() -> CodeExecutionResult:
+    return CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors='')
+
+async def gather_until(awaitables: List[Awaitable[CodeExecutionResult]], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+    """
+    Run awaitables concurrently and return their results in order.
+    When stop_when returns True, unfinished awaitables are cancelled and their results are None.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    index_of = {task: index for index, task in enumerate(tasks)}
+    results: List[Optional[CodeExecutionResult]] = [None] * len(tasks)
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            stop = False
+            for task in sorted(done, key=index_of.get):
+                index = index_of[task]
+                results[index] = task.result()
+                if stop_when is not None and stop_when(index, results[index]):
+                    stop = True
+            if stop:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+class ExecutionBackend(ABC):
+    """Runs source code against stdin inputs and reports results in the Judge0 result shape."""
+
+    name: str
+
+    @abstractmethod
+    def supports(self, language: str) -> bool:
+        """Whether the backend can execute the given language."""
+
+    @abstractmethod
+    async def execute(self, code: str, language: str, stdin: Optional[str]) -> CodeExecutionResult:
+        """Execute the code against a single input."""
+
+    async def execute_batch(self, code: str, language: str, inputs: List[Optional[str]], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+        """
+        Execute the code against every input, preserving input order.
+        Inputs left unexecuted because stop_when fired have a None result.
+        """
+        return await gather_until([self.execute(code, language, stdin) for stdin in inputs], stop_when)
+
+    def stats(self) -> Dict[str, Any]:
+        """Backend specific counters exposed on /metrics."""
+        return {}
+
+    async def start(self) -> None:
+        """Acquire long-lived resources. Called on application startup."""
+
+    async def close(self) -> None:
+        """Release long-lived resources. Called on application shutdown."""
+
+class Judge0Backend(ExecutionBackend):
+    """Executes code through the Judge0 API at COMPILER_API_ENDPOINT."""
+
+    name = "judge0"
+
+    def __init__(self, base_url: Optional[str] = api_url):
+        self.base_url = base_url
+        self.http_client: Optional[httpx.AsyncClient] = None
+
+    def create_http_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=JUDGE0_MAX_CONNECTIONS,
+            max_keepalive_connections=JUDGE0_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=JUDGE0_KEEPALIVE_EXPIRY
+        )
+        return httpx.AsyncClient(limits=limits, http2=JUDGE0_HTTP2, timeout=30)
+
+    async def start(self) -> None:
+        """Create the process-wide Judge0 client."""
+        if self.http_client is None:
+            self.http_client = self.create_http_client()
+
+    async def close(self) -> None:
+        """Close the process-wide Judge0 client and its pooled connections."""
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    def get_http_client(self) -> httpx.AsyncClient:
+        """Return the shared Judge0 client, creating it lazily when used outside the app lifecycle."""
+        if self.http_client is None:
+            self.http_client = self.create_http_client()
+        return self.http_client
+
+    def supports(self, language: str) -> bool:
+        return language.lower() in LANGUAGE_IDS
+
+    def get_language_id(self, language: str) -> int:
+        language_id = LANGUAGE_IDS.get(language.lower())
+        if not language_id:
+            raise ValueError(f"Unsupported language: {language}")
+        return language_id
+
+    def parse_submission(self, response_data: Dict[str, Any]) -> CodeExecutionResult:
+        """Convert a Judge0 submission payload into a CodeExecutionResult."""
+        return CodeExecutionResult(
+            output=response_data.get('stdout', '') or '',
+            stderror=response_data.get('stderr', '') or '',
+            time=response_data.get('time', '0') or '0',
+            memory=response_data.get('memory', '0') or '0',
+            compiler_errors=response_data.get('compile_output', '') or '',
+            status=(response_data.get('status') or {}).get('description')
+        )
+
+    async def execute(self, code: str, language: str, stdin: Optional[str]) -> CodeExecutionResult:
+        """
+        Execute the code using the Judge0 API.
+        """
+        url = f"{self.base_url}/submissions/?base64_encoded=false&wait=true"
+
+        language_id = self.get_language_id(language)
+
+        payload = {
+            'source_code': code,
+            'language_id': language_id,
+            'stdin': stdin
+        }
+
+        try:
+            response = await self.get_http_client().post(url, json=payload, timeout=30)
+            response.raise_for_status()  # Raise HTTP errors
+            response_data = response.json()
+            logger.info(f"Response data: {response_data}")
+
+            return self.parse_submission(response_data)
+        except httpx.HTTPStatusError as e:
+            logger.error(f"HTTP error occurred: {e}")
+            return empty_result()
+
+        except Exception as e:
+            logger.error(f"Execution error occurred: {e}")
+            return empty_result()
+
+    async def submit_batch(self, code: str, language_id: int, inputs: List[Optional[str]]) -> List[Optional[str]]:
+        """Create one Judge0 submission per input and return their tokens (None for rejected submissions)."""
+        url = f"{self.base_url}/submissions/batch?base64_encoded=false"
+        tokens = []
+        for start in range(0, len(inputs), JUDGE0_BATCH_SIZE):
+            chunk = inputs[start:start + JUDGE0_BATCH_SIZE]
+            payload = {
+                'submissions': [
+                    {'source_code': code, 'language_id': language_id, 'stdin': stdin}
+                    for stdin in chunk
+                ]
+            }
+            try:
+                response = await self.get_http_client().post(url, json=payload, timeout=30)
+                response.raise_for_status()
+                created = response.json()
+            except Exception as e:
+                logger.error(f"Batch submission error occurred: {e}")
+                created = [{} for _ in chunk]
+
+            for submission in created:
+                token = submission.get('token')
+                if not token:
+                    logger.error(f"Judge0 rejected submission: {submission}")
+                tokens.append(token)
+        return tokens
+
+    async def poll_batch(self, tokens: List[Optional[str]], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+        """
+        Poll Judge0 with exponential backoff until every token has finished or the poll timeout expires.
+        When stop_when fires, polling ends and unfinished submissions are left with a None result;
+        Judge0 cannot cancel queued submissions, they simply stop being waited for.
+        """
+        results: List[Optional[CodeExecutionResult]] = [empty_result() for _ in tokens]
+        stopped = False
+        pending = {token: index for index, token in enumerate(tokens) if token}
+        delay = JUDGE0_POLL_INITIAL_DELAY
+        deadline = time.monotonic() + JUDGE0_POLL_TIMEOUT
+
+        while pending:
+            await asyncio.sleep(delay)
+            pending_tokens = list(pending)
+            for start in range(0, len(pending_tokens), JUDGE0_BATCH_SIZE):
+                chunk = pending_tokens[start:start + JUDGE0_BATCH_SIZE]
+                url = f"{self.base_url}/submissions/batch"
+                params = {
+                    'tokens': ",".join(chunk),
+                    'base64_encoded': 'false',
+                    'fields': SUBMISSION_FIELDS
+                }
+                try:
+                    response = await self.get_http_client().get(url, params=params, timeout=30)
+                    response.raise_for_status()
+                    submissions = response.json().get('submissions', [])
+                except Exception as e:
+                    logger.error(f"Batch polling error occurred: {e}")
+                    continue
+
+                for submission in submissions:
+                    if not submission or submission.get('token') not in pending:
+                        continue
+                    status_id = (submission.get('status') or {}).get('id')
+                    if status_id in PENDING_STATUS_IDS:
+                        continue
+                    index = pending.pop(submission['token'])
+                    results[index] = self.parse_submission(submission)
+                    if stop_when is not None and stop_when(index, results[index]):
+                        stopped = True
+
+            if stopped:
+                for index in pending.values():
+                    results[index] = None
+                break
+            if pending and time.monotonic() >= deadline:
+                logger.error(f"Timed out waiting for {len(pending)} Judge0 submissions")
+                break
+            delay = min(delay * 2, JUDGE0_POLL_MAX_DELAY)
+
+        return results
+
+    async def execute_batch(self, code: str, language: str, inputs: List[Optional[str]], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+        """
+        Execute the code against every input with a single Judge0 batch submission.
+        Results are returned in the same order as the inputs.
+        """
+        if not inputs:
+            return []
+
+        language_id = self.get_language_id(language)
+
+        try:
+            tokens = await self.submit_batch(code, language_id, inputs)
+            return await self.poll_batch(tokens, stop_when)
+        except Exception as e:
+            logger.error(f"Execution error occurred: {e}")
+            return [empty_result() for _ in inputs]
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import zlib
+from typing import Any, Dict, Optional
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Large text columns are stored once per distinct content in the blobs table, keyed by the
+# SHA-256 of the text. Texts of at least BLOB_COMPRESSION_THRESHOLD bytes are compressed with
+# BLOB_COMPRESSION: zstd by default, from the zstandard package in requirements.txt, or zlib,
+# which is also used when zstandard is not installed.
+BLOB_COMPRESSION = os.getenv("BLOB_COMPRESSION", "zstd").lower()
+BLOB_COMPRESSION_THRESHOLD = int(os.getenv("BLOB_COMPRESSION_THRESHOLD", "512"))
+BLOB_COMPRESSION_LEVEL = int(os.getenv("BLOB_COMPRESSION_LEVEL", "3"))
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def compression() -> str:
+    if BLOB_COMPRESSION == "zstd" and zstandard is not None:
+        return "zstd"
+    return "zlib"
+
+def encode_blob(text: str) -> Dict[str, Any]:
+    """Row of the blobs table for a text; compressed only when that makes it smaller."""
+    raw = text.encode("utf-8")
+    encoding, data = "raw", raw
+    if len(raw) >= BLOB_COMPRESSION_THRESHOLD:
+        if compression() == "zstd":
+            compressed = zstandard.ZstdCompressor(level=BLOB_COMPRESSION_LEVEL).compress(raw)
+        else:
+            compressed = zlib.compress(raw, min(BLOB_COMPRESSION_LEVEL, 9))
+        if len(compressed) < len(raw):
+            encoding, data = compression(), compressed
+    return {"hash": content_hash(text), "encoding": encoding, "data": data, "size": len(raw)}
+
+def decode_blob(encoding: str, data: bytes) -> str:
+    if encoding == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Reading zstd blobs requires the zstandard package")
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    elif encoding == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raw = data
+    return bytes(raw).decode("utf-8")
+
+class BlobWriter:
+    """Collects the distinct texts of a batch of rows and hands out their hashes."""
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, text: Optional[str]) -> Optional[str]:
+        if text is None:
+            return None
+        key = content_hash(text)
+        if key not in self.rows:
+            self.rows[key] = encode_blob(text)
+        return key
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from db import get_cache_entries, get_cache_entry, save_cache_entries, save_cache_entry
+
+logger = logging.getLogger(__name__)
+
+def hash_key(*parts: Any) -> str:
+    """Build a stable content hash from JSON-serializable parts."""
+    serialized = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """In-memory LRU cache with size and TTL based eviction."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            self.evictions += 1
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+class TieredCache:
+    """
+    Two-tier cache: a per-process LRU in front of an optional shared table in the database.
+    Values must be JSON-serializable dictionaries.
+    """
+
+    def __init__(self, namespace: str, max_size: int, ttl: float, persistent: bool = False):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.persistent = persistent
+        self.memory = LRUCache(max_size, ttl)
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        if self.persistent:
+            try:
+                value = await get_cache_entry(self.namespace, key)
+            except Exception as e:
+                logger.error(f"Cache lookup failed for {self.namespace}: {e}")
+                value = None
+            if value is not None:
+                self.persistent_hits += 1
+                self.memory.set(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        if self.persistent:
+            try:
+                await save_cache_entry(self.namespace, key, value, self.ttl)
+            except Exception as e:
+                logger.error(f"Cache write failed for {self.namespace}: {e}")
+
+    async def get_many(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Look up several keys at once, reading the ones missing from memory in a single database query."""
+        values = [self.memory.get(key) for key in keys]
+        self.memory_hits += sum(value is not None for value in values)
+
+        missing = [index for index, value in enumerate(values) if value is None]
+        if self.persistent and missing:
+            try:
+                stored = await get_cache_entries(self.namespace, list({keys[index] for index in missing}))
+            except Exception as e:
+                logger.error(f"Cache lookup failed for {self.namespace}: {e}")
+                stored = {}
+            for index in missing:
+                value = stored.get(keys[index])
+                if value is not None:
+                    self.persistent_hits += 1
+                    self.memory.set(keys[index], value)
+                    values[index] = value
+
+        self.misses += sum(value is None for value in values)
+        return values
+
+    async def set_many(self, values: Dict[str, Dict[str, Any]]) -> None:
+        """Store several values at once, writing them to the database in a single statement."""
+        for key, value in values.items():
+            self.memory.set(key, value)
+        if self.persistent and values:
+            try:
+                await save_cache_entries(self.namespace, values, self.ttl)
+            except Exception as e:
+                logger.error(f"Cache write failed for {self.namespace}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "size": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.memory.evictions,
+            "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from openai import AsyncOpenAI
+
+from cache import hash_key
+
+logger = logging.getLogger(__name__)
+
+# Bounds for the shared LLM clients; each one owns a connection pool to its provider
+CLIENT_REGISTRY_SIZE = int(os.getenv("CLIENT_REGISTRY_SIZE", "32"))
+CLIENT_IDLE_TTL = float(os.getenv("CLIENT_IDLE_TTL", "600"))
+
+@dataclass
+class ClientEntry:
+    client: AsyncOpenAI
+    last_used: float
+    in_use: int = 0
+
+class ClientRegistry:
+    """
+    Shares AsyncOpenAI clients across requests, keyed by base URL and a hash of the API key.
+    Clients are borrowed with acquire and handed back with release; idle ones are closed after
+    CLIENT_IDLE_TTL seconds and the least recently used are closed beyond max_size.
+    """
+
+    def __init__(self, max_size: int = CLIENT_REGISTRY_SIZE, idle_ttl: float = CLIENT_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.entries: "OrderedDict[str, ClientEntry]" = OrderedDict()
+        self.created = 0
+        self.reused = 0
+        self.evictions = 0
+
+    def client_key(self, base_url: str, api_key: str) -> str:
+        return hash_key(base_url, hashlib.sha256(api_key.encode("utf-8")).hexdigest())
+
+    def acquire(self, base_url: str, api_key: str) -> AsyncOpenAI:
+        key = self.client_key(base_url, api_key)
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = ClientEntry(AsyncOpenAI(api_key=api_key, base_url=base_url), time.monotonic())
+            self.entries[key] = entry
+            self.created += 1
+        else:
+            self.reused += 1
+        self.entries.move_to_end(key)
+        entry.in_use += 1
+        entry.last_used = time.monotonic()
+        self.evict()
+        return entry.client
+
+    def release(self, client: AsyncOpenAI) -> None:
+        for entry in self.entries.values():
+            if entry.client is client:
+                entry.in_use -= 1
+                entry.last_used = time.monotonic()
+                break
+        self.evict()
+
+    def evict(self) -> None:
+        """Close idle clients and the least recently used beyond max_size, skipping borrowed ones."""
+        now = time.monotonic()
+        expired: List[AsyncOpenAI] = []
+        for key in list(self.entries):
+            entry = self.entries[key]
+            if entry.in_use:
+                continue
+            if len(self.entries) > self.max_size or now - entry.last_used > self.idle_ttl:
+                del self.entries[key]
+                expired.append(entry.client)
+                self.evictions += 1
+        for client in expired:
+            asyncio.ensure_future(self.close_client(client))
+
+    async def close_client(self, client: AsyncOpenAI) -> None:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Failed to close LLM client: {e}")
+
+    async def close(self) -> None:
+        """Close every client. Called on application shutdown."""
+        entries = list(self.entries.values())
+        self.entries.clear()
+        await asyncio.gather(*(self.close_client(entry.client) for entry in entries))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self.entries),
+            "in_use": sum(entry.in_use for entry in self.entries.values()),
+            "created": self.created,
+            "reused": self.reused,
+            "evictions": self.evictions,
+        }
+
+client_registry = ClientRegistry()
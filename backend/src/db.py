@@ -1,64 +1,315 @@
-from db_models import Base, engine, SessionLocal, Question, Iteration, TestCaseResult
-from sqlalchemy.orm import Session
+from db_models import SessionLocal, Question, Iteration, TestCaseResult, CacheEntry, TestSuite, Blob
+from blobs import BlobWriter, content_hash, decode_blob
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.dialects.postgresql import insert
 import uuid
+import base64
 import datetime
+import hashlib
+import json
+import re
 
-def save_question(model, question_text, explanation, user_input, language, max_iterations, question_code=None):
-    session = SessionLocal()
+def question_hash(question_text):
+    """Hash of the question text with case and whitespace differences removed."""
+    normalized = re.sub(r"\s+", " ", (question_text or "").strip().lower())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+# Text columns stored in the blobs table: text key taken by save_pipeline_results -> hash column
+ITERATION_BLOBS = {"generated_code": "generated_code_hash"}
+TEST_CASE_BLOBS = {
+    "input": "input_hash",
+    "expected_output": "expected_output_hash",
+    "actual_output": "actual_output_hash",
+    "stderror": "stderror_hash",
+}
+
+def with_blobs(row, columns, blobs):
+    """Replace the row's large texts with references to their blobs."""
+    row = dict(row)
+    for text_key, hash_column in columns.items():
+        if text_key in row:
+            row[hash_column] = blobs.add(row.pop(text_key))
+    return row
+
+async def load_texts(session, hashes):
+    """Decoded texts of the given blob hashes, fetched in one query."""
+    hashes = {key for key in hashes if key is not None}
+    if not hashes:
+        return {}
+    blobs = (await session.execute(select(Blob).where(Blob.hash.in_(hashes)))).scalars()
+    return {blob.hash: decode_blob(blob.encoding, blob.data) for blob in blobs}
+
+async def save_pipeline_results(runs):
+    """
+    Save pipeline runs, each a (question, iterations) pair, in one transaction.
+
+    question holds the Question columns; each iteration holds the Iteration columns plus a
+    "test_results" list of TestCaseResult columns. The question id and created_at may be given and
+    are filled in otherwise. Iteration and test case result ids are derived from the question id, so
+    each table is written with a single batched INSERT, nothing has to be read back, and saving a
+    run again is a no-op. Code and test case texts go to the blobs table, once per distinct text.
+    """
+    blobs = BlobWriter()
+    question_rows = []
+    iteration_rows = []
+    test_case_rows = []
+    for question, iterations in runs:
+        question_id = question.get("id") or uuid.uuid4()
+        question_rows.append({
+            **question,
+            "id": question_id,
+            "question_hash": question_hash(question.get("question")),
+            "created_at": question.get("created_at") or datetime.datetime.now(datetime.timezone.utc)
+        })
+        for iteration in iterations:
+            iteration_id = uuid.uuid5(question_id, str(iteration["iteration_number"]))
+            iteration_rows.append({
+                **with_blobs({key: value for key, value in iteration.items() if key != "test_results"}, ITERATION_BLOBS, blobs),
+                "id": iteration_id,
+                "question_id": question_id
+            })
+            test_case_rows.extend(
+                {**with_blobs(test_result, TEST_CASE_BLOBS, blobs), "id": uuid.uuid5(iteration_id, str(index)), "iteration_id": iteration_id, "position": index}
+                for index, test_result in enumerate(iteration.get("test_results", []))
+            )
+
+    # Blobs are inserted in hash order so concurrent saves sharing texts lock them in the same order
+    blob_rows = [blobs.rows[key] for key in sorted(blobs.rows)]
+    async with SessionLocal() as session, session.begin():
+        if blob_rows:
+            await session.execute(insert(Blob).on_conflict_do_nothing(index_elements=[Blob.hash]), blob_rows)
+        for model, rows in ((Question, question_rows), (Iteration, iteration_rows), (TestCaseResult, test_case_rows)):
+            if rows:
+                await session.execute(insert(model).on_conflict_do_nothing(index_elements=[model.id]), rows)
+
+async def save_pipeline_result(question, iterations):
+    """Save one question with its iterations and test case results; returns the question id."""
+    question = {**question, "id": question.get("id") or uuid.uuid4()}
+    await save_pipeline_results([(question, iterations)])
+    return question["id"]
+
+async def find_solved_iteration(language, question_text, question_code=None):
+    """
+    Return the most recent passing iteration with stored code for the same question in the same language,
+    matched by question_code when given and by the normalized question hash otherwise.
+    """
+    query = (
+        select(Iteration)
+        .join(Question, Iteration.question_id == Question.id)
+        .where(
+            Iteration.success.is_(True),
+            Iteration.generated_code_hash.isnot(None),
+            Iteration.generated_code_hash != content_hash(""),
+            Question.language == language
+        )
+    )
+    if question_code:
+        query = query.where(Question.question_code == question_code)
+    else:
+        query = query.where(Question.question_hash == question_hash(question_text))
+    query = query.order_by(Question.created_at.desc(), Iteration.iteration_number.desc()).limit(1)
+
+    async with SessionLocal() as session:
+        iteration = (await session.execute(query)).scalars().first()
+        if iteration is None:
+            return None
+        texts = await load_texts(session, [iteration.generated_code_hash])
+        return {
+            "id": iteration.id,
+            "chain_of_thought": iteration.chain_of_thought or [],
+            "generated_code": texts.get(iteration.generated_code_hash),
+            "model": iteration.model,
+        }
+
+def encode_cursor(created_at, question_id):
+    """Opaque keyset cursor pointing after the given question in newest-first order."""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{question_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor."""
     try:
-        question = Question(
+        created_at, question_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(question_id)
+    except (UnicodeError, ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+async def list_questions(model=None, language=None, question_code=None, created_after=None, created_before=None, limit=20, cursor=None):
+    """
+    Return a page of questions, newest first, and the cursor of the next page (None on the last page).
+    Pages are keyed on (created_at, id), so each page is an index range scan however deep it is.
+    """
+    query = select(Question).options(load_only(
+        Question.id, Question.model, Question.question, Question.language,
+        Question.question_code, Question.max_iterations, Question.created_at
+    ))
+    if model:
+        query = query.where(Question.model == model)
+    if language:
+        query = query.where(Question.language == language)
+    if question_code:
+        query = query.where(Question.question_code == question_code)
+    if created_after:
+        query = query.where(Question.created_at >= created_after)
+    if created_before:
+        query = query.where(Question.created_at < created_before)
+    if cursor:
+        query = query.where(tuple_(Question.created_at, Question.id) < tuple_(*decode_cursor(cursor)))
+    query = query.order_by(Question.created_at.desc(), Question.id.desc()).limit(limit + 1)
+
+    async with SessionLocal() as session:
+        questions = (await session.execute(query)).scalars().all()
+    next_cursor = None
+    if len(questions) > limit:
+        questions = questions[:limit]
+        next_cursor = encode_cursor(questions[-1].created_at, questions[-1].id)
+    return [question_summary(question) for question in questions], next_cursor
+
+async def get_question(question_id):
+    """Return a question with its iterations and their test case results, or None if it does not exist."""
+    query = (
+        select(Question)
+        .where(Question.id == question_id)
+        .options(selectinload(Question.iterations).selectinload(Iteration.test_cases))
+    )
+    async with SessionLocal() as session:
+        question = (await session.execute(query)).scalars().first()
+        if question is None:
+            return None
+        hashes = []
+        for iteration in question.iterations:
+            hashes.append(iteration.generated_code_hash)
+            for result in iteration.test_cases:
+                hashes.extend(getattr(result, column) for column in TEST_CASE_BLOBS.values())
+        texts = await load_texts(session, hashes)
+    return {
+        **question_summary(question),
+        "explanation": question.explanation,
+        "user_input": question.user_input,
+        "iterations": [
+            {
+                "id": iteration.id,
+                "iteration_number": iteration.iteration_number,
+                "chain_of_thought": iteration.chain_of_thought or [],
+                "generated_code": texts.get(iteration.generated_code_hash),
+                "success": iteration.success,
+                "model": iteration.model,
+                "input_tokens": iteration.input_tokens,
+                "llm_latency": iteration.llm_latency,
+                "test_results": [
+                    {
+                        "input": texts.get(result.input_hash),
+                        "expected_output": texts.get(result.expected_output_hash),
+                        "actual_output": texts.get(result.actual_output_hash),
+                        "execution_time": result.execution_time,
+                        "memory_usage": result.memory_usage,
+                        "stderror": texts.get(result.stderror_hash),
+                        "compiler_errors": result.compiler_errors,
+                        "passed": result.passed,
+                        "skipped": result.skipped,
+                    }
+                    for result in iteration.test_cases
+                ],
+            }
+            for iteration in sorted(question.iterations, key=lambda iteration: iteration.iteration_number or 0)
+        ],
+    }
+
+def question_summary(question):
+    return {
+        "id": question.id,
+        "model": question.model,
+        "question": question.question,
+        "language": question.language,
+        "question_code": question.question_code,
+        "max_iterations": question.max_iterations,
+        "created_at": question.created_at,
+    }
+
+def question_key(question_text, question_code=None):
+    """Identify a question by its question_code when given, otherwise by its normalized hash."""
+    return question_code or question_hash(question_text)
+
+async def get_test_suite(language, model, question_text, question_code=None):
+    """Return the most recently stored test cases generated by the model for this question and language."""
+    query = (
+        select(TestSuite.test_cases)
+        .where(
+            TestSuite.question_key == question_key(question_text, question_code),
+            TestSuite.language == language,
+            TestSuite.model == model
+        )
+        .order_by(TestSuite.created_at.desc())
+        .limit(1)
+    )
+    async with SessionLocal() as session:
+        return (await session.execute(query)).scalars().first()
+
+async def save_test_suite(language, model, question_text, test_cases, question_code=None):
+    """Store generated test cases; a suite identical to one already stored for the question is not duplicated."""
+    async with SessionLocal() as session:
+        content_hash = hashlib.sha256(json.dumps(test_cases, sort_keys=True).encode("utf-8")).hexdigest()
+        statement = insert(TestSuite).values(
             id=uuid.uuid4(),
-            model=model,
-            question=question_text,
-            explanation=explanation,
-            user_input=user_input,
+            question_key=question_key(question_text, question_code),
             language=language,
-            max_iterations=max_iterations,
-            question_code=question_code,
-            created_at=datetime.datetime.now().isoformat()
+            model=model,
+            content_hash=content_hash,
+            test_cases=test_cases
+        )
+        # A regenerated suite identical to a stored one becomes the latest again
+        statement = statement.on_conflict_do_update(
+            index_elements=[TestSuite.question_key, TestSuite.language, TestSuite.model, TestSuite.content_hash],
+            set_={"created_at": func.now()}
         )
-        session.add(question)
-        session.commit()
-        session.refresh(question)  # Get the generated UUID
-        return question
-    finally:
-        session.close()
+        await session.execute(statement)
+        await session.commit()
 
+async def get_cache_entry(namespace, key):
+    async with SessionLocal() as session:
+        entry = await session.get(CacheEntry, (namespace, key))
+        if entry is None or entry.expires_at < datetime.datetime.now(datetime.timezone.utc):
+            return None
+        return entry.value
 
-def save_iteration(question_id, iteration_number, chain_of_thought, generated_code, success):
-    session = SessionLocal()
-    try:
-        iteration = Iteration(
-            id=uuid.uuid4(),
-            question_id=question_id,
-            iteration_number=iteration_number,
-            chain_of_thought=chain_of_thought,
-            generated_code=generated_code,
-            success=success
+async def save_cache_entry(namespace, key, value, ttl_seconds):
+    async with SessionLocal() as session:
+        expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl_seconds)
+        statement = insert(CacheEntry).values(namespace=namespace, key=key, value=value, expires_at=expires_at)
+        statement = statement.on_conflict_do_update(
+            index_elements=[CacheEntry.namespace, CacheEntry.key],
+            set_={"value": statement.excluded.value, "expires_at": statement.excluded.expires_at}
         )
-        session.add(iteration)
-        session.commit()
-        session.refresh(iteration)
-        return iteration
-    finally:
-        session.close()
-
-def save_test_case_results(iteration_id, input_data, expected_output, actual_output, execution_time, memory_usage, stderror, compiler_errors, passed):
-    session = SessionLocal()
-    try:
-        test_case_result = TestCaseResult(
-            id=uuid.uuid4(),
-            iteration_id=iteration_id,
-            input=input_data,
-            expected_output=expected_output,
-            actual_output=actual_output,
-            execution_time=execution_time,
-            memory_usage=memory_usage,
-            stderror=stderror,
-            compiler_errors=compiler_errors,
-            passed=passed
+        await session.execute(statement)
+        await session.commit()
+
+async def get_cache_entries(namespace, keys):
+    """Return the unexpired values stored for any of the keys, by key, in one query."""
+    if not keys:
+        return {}
+    now = datetime.datetime.now(datetime.timezone.utc)
+    async with SessionLocal() as session:
+        rows = await session.execute(
+            select(CacheEntry.key, CacheEntry.value)
+            .where(CacheEntry.namespace == namespace, CacheEntry.key.in_(keys), CacheEntry.expires_at >= now)
+        )
+        return {key: value for key, value in rows}
+
+async def save_cache_entries(namespace, values, ttl_seconds):
+    """Upsert a {key: value} mapping in one statement."""
+    if not values:
+        return
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl_seconds)
+    # Rows are written in key order so concurrent saves sharing keys lock them in the same order
+    rows = [
+        {"namespace": namespace, "key": key, "value": values[key], "expires_at": expires_at}
+        for key in sorted(values)
+    ]
+    async with SessionLocal() as session:
+        statement = insert(CacheEntry).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[CacheEntry.namespace, CacheEntry.key],
+            set_={"value": statement.excluded.value, "expires_at": statement.excluded.expires_at}
         )
-        session.add(test_case_result)
-        session.commit()
-    finally:
-        session.close()
\ No newline at end of file
+        await session.execute(statement)
+        await session.commit()
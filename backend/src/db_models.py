@@ -1,6 +1,14 @@
-from sqlalchemy import create_engine, Column, String, Integer, Boolean, ForeignKey, Float, Text, ARRAY, TIMESTAMP, func
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Float, Text, LargeBinary, ARRAY, TIMESTAMP, Index, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import UUID, JSONB
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from collections import deque
+from typing import Any, Deque, Dict
+import math
+import time
 import uuid
 import os
 from dotenv import load_dotenv
@@ -11,11 +19,87 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set.")
 
+# Connections per worker process; with gunicorn the database sees
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections at most
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before failing, and before a connection is replaced
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Server-side limit for each statement in milliseconds (0 disables it)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+# Number of recent checkout waits kept for the pool metrics
+DB_POOL_METRICS_WINDOW = int(os.getenv("DB_POOL_METRICS_WINDOW", "1000"))
+
+class PoolMetrics:
+    """Records how long checkouts wait for a connection from the pool, and how often they time out."""
+
+    def __init__(self, window: int = DB_POOL_METRICS_WINDOW):
+        self.waits: Deque[float] = deque(maxlen=window)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.waits.append(seconds)
+        self.max_wait = max(self.max_wait, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.waits:
+            return 0.0
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+    def stats(self, pool: Any) -> Dict[str, Any]:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_avg_ms": round(1000 * sum(self.waits) / len(self.waits), 3) if self.waits else 0.0,
+            "wait_p95_ms": round(1000 * self.percentile(0.95), 3),
+            "wait_max_ms": round(1000 * self.max_wait, 3),
+        }
+
+pool_metrics = PoolMetrics()
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that reports checkout waits to pool_metrics."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        pool_metrics.record(time.perf_counter() - start)
+        return connection
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with its driver switched to asyncpg (the migrations keep using the synchronous driver)."""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
 # Create database engine
-engine = create_engine(DATABASE_URL)
+engine: AsyncEngine = create_async_engine(
+    async_database_url(DATABASE_URL),
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+)
 
 # Create a session factory
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+def pool_stats() -> Dict[str, Any]:
+    return pool_metrics.stats(engine.pool)
 
 # Base class for models
 Base = declarative_base()
@@ -23,15 +107,22 @@ Base = declarative_base()
 # Question Model
 class Question(Base):
     __tablename__ = "questions"
+    __table_args__ = (
+        # Keyset pagination of the history API, newest first, overall and per model or language
+        Index("ix_questions_created_at_id", "created_at", "id"),
+        Index("ix_questions_model_created_at_id", "model", "created_at", "id"),
+        Index("ix_questions_language_created_at_id", "language", "created_at", "id"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     model = Column(String(255))
     question = Column(Text)
+    question_hash = Column(String(64), index=True)
     explanation = Column(Text)
     user_input = Column(String(255))
     language = Column(String(50))
     max_iterations = Column(Integer)
-    question_code = Column(Text)
+    question_code = Column(Text, index=True)
     created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
 
     iterations = relationship("Iteration", back_populates="question", cascade="all, delete-orphan")
@@ -41,28 +132,70 @@ class Iteration(Base):
     __tablename__ = "iterations"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id", ondelete="CASCADE"))
+    question_id = Column(UUID(as_uuid=True), ForeignKey("questions.id", ondelete="CASCADE"), index=True)
     iteration_number = Column(Integer)
     chain_of_thought = Column(ARRAY(Text))
-    generated_code = Column(Text)
+    generated_code_hash = Column(String(64), ForeignKey("blobs.hash"))
     success = Column(Boolean)
+    model = Column(String(255))
+    input_tokens = Column(Integer)
+    llm_latency = Column(Float)
 
     question = relationship("Question", back_populates="iterations")
-    test_cases = relationship("TestCaseResult", back_populates="iteration", cascade="all, delete-orphan")
+    test_cases = relationship("TestCaseResult", back_populates="iteration", cascade="all, delete-orphan", order_by="TestCaseResult.position")
 
 # Test Case Result Model
 class TestCaseResult(Base):
     __tablename__ = "test_case_results"
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    iteration_id = Column(UUID(as_uuid=True), ForeignKey("iterations.id", ondelete="CASCADE"))
-    input = Column(Text)
-    expected_output = Column(Text)
-    actual_output = Column(Text)
+    iteration_id = Column(UUID(as_uuid=True), ForeignKey("iterations.id", ondelete="CASCADE"), index=True)
+    # Index of the result within its iteration, so results load in the order they were run
+    position = Column(Integer)
+    input_hash = Column(String(64), ForeignKey("blobs.hash"))
+    expected_output_hash = Column(String(64), ForeignKey("blobs.hash"))
+    actual_output_hash = Column(String(64), ForeignKey("blobs.hash"))
     execution_time = Column(Float)
     memory_usage = Column(Integer)
-    stderror = Column(Text)
+    stderror_hash = Column(String(64), ForeignKey("blobs.hash"))
     compiler_errors = Column(Text)
     passed = Column(Boolean)
+    skipped = Column(Boolean, server_default="false")
 
     iteration = relationship("Iteration", back_populates="test_cases")
+
+# Blob Model (large texts stored once per distinct content, see blobs.py)
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)
+    encoding = Column(String(10), nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+
+# Cache Entry Model (shared persistent tier for in-process caches)
+class CacheEntry(Base):
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String(50), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    value = Column(JSONB)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    expires_at = Column(TIMESTAMP(timezone=True), index=True)
+
+# Test Suite Model (generated test cases reused by later requests for the same question)
+class TestSuite(Base):
+    __tablename__ = "test_suites"
+    __table_args__ = (
+        UniqueConstraint("question_key", "language", "model", "content_hash"),
+        Index("ix_test_suites_lookup", "question_key", "language", "model", "created_at"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    question_key = Column(String(255), nullable=False)
+    language = Column(String(50), nullable=False)
+    model = Column(String(255), nullable=False)
+    content_hash = Column(String(64), nullable=False)
+    test_cases = Column(JSONB)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
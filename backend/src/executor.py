@@ -1,82 +1,174 @@
-import httpx
 import logging
 from models import CodeExecutionResult, TestCase
-from typing import List, Dict, Any
+from cache import TieredCache, hash_key
+from backends import ExecutionBackend, Judge0Backend, StopCondition, gather_until
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
 import os
 import json
+import asyncio
 
 load_dotenv()
 
-api_url = os.getenv('COMPILER_API_ENDPOINT')
+# Which ExecutionBackend runs submissions: "judge0" (COMPILER_API_ENDPOINT) or "local" (sandboxed subprocesses)
+EXECUTION_BACKEND = os.getenv('EXECUTION_BACKEND', 'judge0').lower()
+
+# Content-addressed cache of deterministic execution results
+EXECUTION_CACHE_ENABLED = os.getenv('EXECUTION_CACHE_ENABLED', 'true').lower() == 'true'
+EXECUTION_CACHE_SIZE = int(os.getenv('EXECUTION_CACHE_SIZE', '2048'))
+EXECUTION_CACHE_TTL = float(os.getenv('EXECUTION_CACHE_TTL', '3600'))
+EXECUTION_CACHE_PERSISTENT = os.getenv('EXECUTION_CACHE_PERSISTENT', 'false').lower() == 'true'
+
+# Upper bound on in-flight submissions across all requests handled by this worker
+EXECUTOR_MAX_CONCURRENCY = int(os.getenv('EXECUTOR_MAX_CONCURRENCY', '16'))
+# Default per-request cap when the request does not specify one
+EXECUTOR_REQUEST_CONCURRENCY = int(os.getenv('EXECUTOR_REQUEST_CONCURRENCY', '8'))
+
+EXECUTION_MODES = ("batch", "concurrent", "sequential")
+
+global_semaphore = asyncio.Semaphore(EXECUTOR_MAX_CONCURRENCY)
+
+execution_cache = TieredCache(
+    namespace="execution",
+    max_size=EXECUTION_CACHE_SIZE,
+    ttl=EXECUTION_CACHE_TTL,
+    persistent=EXECUTION_CACHE_PERSISTENT
+)
 
 logger = logging.getLogger(__name__)
 
-LANGUAGE_IDS = {
-    "python": 71,
-    "cpp": 54,
-    "c": 50,
-    "javascript": 63,
-    "java": 62,
-    "ruby": 72,
-    "rust": 73,
-    "r": 80,
-    "go": 60,
-    "swift": 83,
-    "typescript": 74,
-    "php": 68,
-}
+def create_backend(name: str) -> ExecutionBackend:
+    if name == "judge0":
+        return Judge0Backend()
+    if name == "local":
+        from sandbox import LocalSandboxBackend, isolation_error
+        # Untrusted programs must not run with the server's privileges
+        error = isolation_error()
+        if error is not None:
+            raise ValueError(f"The local execution backend is unavailable: {error}")
+        return LocalSandboxBackend()
+    raise ValueError(f"Unsupported execution backend: {name}")
+
+backend = create_backend(EXECUTION_BACKEND)
+
+async def start_backend() -> None:
+    """Acquire the execution backend's long-lived resources. Called on application startup."""
+    await backend.start()
+
+async def close_backend() -> None:
+    """Release the execution backend's long-lived resources. Called on application shutdown."""
+    await backend.close()
+
+def check_language(language: str) -> None:
+    if not backend.supports(language):
+        raise ValueError(f"Unsupported language: {language}")
+
+def is_cacheable(result: CodeExecutionResult) -> bool:
+    """Only results of runs that completed normally are deterministic enough to reuse."""
+    return result.status == "Accepted" and not result.stderror and not result.compiler_errors
+
+def execution_cache_key(code: str, language: str, stdin: Optional[str]) -> str:
+    return hash_key(language.lower(), code, stdin)
 
 async def execute_code(code: str, language: str, input: str) -> CodeExecutionResult:
     """
-    Execute the code using the Judge0 API.
+    Execute the code using the configured execution backend.
     """
-    url = f"{api_url}/submissions/?base64_encoded=false&wait=true"
+    check_language(language)
+    return await backend.execute(code, language, input)
 
-    language_id = LANGUAGE_IDS.get(language.lower())
-    if not language_id:
-        raise ValueError(f"Unsupported language: {language}")
-    
-    payload = {
-        'source_code': code,
-        'language_id': language_id,
-        'stdin': input
-    }
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, timeout=30)
-            response.raise_for_status()  # Raise HTTP errors
-            response_data = response.json()
-            logger.info(f"Response data: {response_data}")
-            
-         
-            stderr = response_data.get('stderr', '') or ''
-            stdout = response_data.get('stdout', '') or ''
-            time = response_data.get('time', '0')
-            memory = response_data.get('memory', '0')
-            compiler_errors = response_data.get('compile_output', '') or ''
-            
-            return CodeExecutionResult(
-                output=stdout,
-                stderror=stderr,
-                time=time,
-                memory=memory,
-                compiler_errors=compiler_errors
-            )
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP error occurred: {e}")
-        return CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors='')
-
-    except Exception as e:
-        logger.error(f"Execution error occurred: {e}")
-        return CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors='')
-
-async def validate_test_cases(code: str, language: str, test_cases: List[TestCase]) -> List[Dict[str, Any]]:
+async def execute_batch(code: str, language: str, inputs: List[str], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+    """
+    Execute the code against every input in one backend batch (a single Judge0 batch submission).
+    Results are returned in the same order as the inputs.
+    """
+    if not inputs:
+        return []
+    check_language(language)
+    return await backend.execute_batch(code, language, inputs, stop_when)
+
+def request_semaphore(max_concurrency: Optional[int] = None) -> asyncio.Semaphore:
+    """The semaphore capping one request's in-flight submissions, shared by every execution of that request."""
+    return asyncio.Semaphore(max_concurrency or EXECUTOR_REQUEST_CONCURRENCY)
+
+async def execute_concurrently(code: str, language: str, inputs: List[str], semaphore: Optional[asyncio.Semaphore] = None, stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+    """
+    Execute the code against every input with parallel single submissions.
+    Submissions are capped by the request's semaphore (a fresh request_semaphore() when none is
+    given) and by EXECUTOR_MAX_CONCURRENCY overall.
+    Results are returned in the same order as the inputs.
+    """
+    check_language(language)
+    semaphore = semaphore or request_semaphore()
+
+    async def run(stdin: str) -> CodeExecutionResult:
+        async with semaphore:
+            async with global_semaphore:
+                return await execute_code(code, language, stdin)
+
+    return await gather_until([run(stdin) for stdin in inputs], stop_when)
+
+async def execute_sequentially(code: str, language: str, inputs: List[str], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+    results: List[Optional[CodeExecutionResult]] = [None] * len(inputs)
+    for index, stdin in enumerate(inputs):
+        results[index] = await execute_code(code, language, stdin)
+        if stop_when is not None and stop_when(index, results[index]):
+            break
+    return results
+
+async def execute_many(code: str, language: str, inputs: List[str], mode: str = "batch", semaphore: Optional[asyncio.Semaphore] = None, stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+    """
+    Execute the code against every input using the given execution mode, preserving input order.
+    Inputs whose result is already cached are not sent to the executor again.
+    stop_when is called with (input index, result) as results arrive; once it returns True the
+    remaining runs are cancelled and their results are None.
+    """
+    if mode not in EXECUTION_MODES:
+        raise ValueError(f"Unsupported execution mode: {mode}")
+    if not EXECUTION_CACHE_ENABLED:
+        return await run_inputs(code, language, inputs, mode, semaphore, stop_when)
+
+    keys = [execution_cache_key(code, language, stdin) for stdin in inputs]
+    cached_values = await execution_cache.get_many(keys)
+    results: List[Optional[CodeExecutionResult]] = [
+        CodeExecutionResult(**cached) if cached is not None else None
+        for cached in cached_values
+    ]
+
+    for index, result in enumerate(results):
+        if result is not None and stop_when is not None and stop_when(index, result):
+            return results
+
+    missing = [index for index, result in enumerate(results) if result is None]
+    if missing:
+        # Report fresh results to stop_when under their original input index
+        missing_stop_when = None
+        if stop_when is not None:
+            missing_stop_when = lambda position, result: stop_when(missing[position], result)
+
+        fresh_results = await run_inputs(code, language, [inputs[index] for index in missing], mode, semaphore, missing_stop_when)
+        writes = {}
+        for index, result in zip(missing, fresh_results):
+            results[index] = result
+            if result is not None and is_cacheable(result):
+                writes[keys[index]] = result.dict()
+        await execution_cache.set_many(writes)
+    return results
+
+async def run_inputs(code: str, language: str, inputs: List[str], mode: str, semaphore: Optional[asyncio.Semaphore], stop_when: Optional[StopCondition] = None) -> List[Optional[CodeExecutionResult]]:
+    if mode == "batch":
+        return await execute_batch(code, language, inputs, stop_when)
+    if mode == "concurrent":
+        return await execute_concurrently(code, language, inputs, semaphore, stop_when)
+    if mode == "sequential":
+        return await execute_sequentially(code, language, inputs, stop_when)
+    raise ValueError(f"Unsupported execution mode: {mode}")
+
+async def validate_test_cases(code: str, language: str, test_cases: List[TestCase], mode: str = "batch", max_concurrency: Optional[int] = None) -> List[Dict[str, Any]]:
     """Validate the code against all test cases"""
     test_results = []
-    for test_case in test_cases:
-        execution_result = await execute_code(code, language, test_case.input)
+    execution_results = await execute_many(code, language, [test_case.input for test_case in test_cases], mode, request_semaphore(max_concurrency))
+    for test_case, execution_result in zip(test_cases, execution_results):
 
         expected_output = test_case.expected_output.strip()
         actual_output = execution_result.output.strip()
@@ -1,70 +1,271 @@
+import asyncio
 import json
-from openai import OpenAI
-from typing import List, Dict, Any
-from prompts import SYSTEM_PROMPT, REFINE_PROMPT, TEST_CASE_GENERATION_PROMPT, VALIDATE_TEST_CASES_PROMPT
-from langchain.output_parsers import PydanticOutputParser
+import os
+import hashlib
+import time
+from dataclasses import dataclass
+from openai import AsyncOpenAI
+from typing import Callable, List, Dict, Any, Optional, Tuple
+from prompts import output_parser, SYSTEM_PROMPT, REFINE_PROMPT, CONVERSATION_REFINE_PROMPT, TEST_CASE_GENERATION_PROMPT, VALIDATE_TEST_CASES_PROMPT
 from models import TestCaseValidationResult, TestCaseResult
+from cache import TieredCache, hash_key
+from clients import client_registry
+from hedging import hedge_tracker, hedging_configured, LLM_HEDGE_BASE_URL, LLM_HEDGE_API_KEY, LLM_HEDGE_MODELS
+from prompt_budget import build_refine_prompt, count_tokens
 import logging
 import re
 
 logger = logging.getLogger(__name__)
 
+# Seconds allowed for a single LLM call before it is abandoned
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Sampling parameters used for every completion; low enough that reusing an earlier answer is acceptable
+TEMPERATURE = 0.1
+TOP_P = 0.1
+
+# Temperature for the extra candidates of best-of-N generation, high enough that they differ from the first
+CANDIDATE_TEMPERATURE = float(os.getenv("CANDIDATE_TEMPERATURE", "0.7"))
+
+# Cache of completions keyed by provider, model, sampling parameters and prompt
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_PERSISTENT = os.getenv("LLM_CACHE_PERSISTENT", "false").lower() == "true"
+
+llm_cache = TieredCache(
+    namespace="llm",
+    max_size=LLM_CACHE_SIZE,
+    ttl=LLM_CACHE_TTL,
+    persistent=LLM_CACHE_PERSISTENT
+)
+
+# "prompt" rebuilds a standalone refine prompt every iteration; "conversation" appends each
+# iteration's failures as a new turn so the provider can reuse the cached prefix
+REFINEMENT_MODES = ("prompt", "conversation")
+
+@dataclass
+class Completion:
+    """An LLM answer together with the messages it answered and what it cost."""
+    content: str
+    messages: List[Dict[str, str]]
+    input_tokens: Optional[int] = None
+    latency: float = 0.0
+    cached: bool = False
+
+    @property
+    def conversation(self) -> List[Dict[str, str]]:
+        """The messages followed by this answer, ready to be continued with another turn."""
+        return self.messages + [{"role": "assistant", "content": self.content}]
+
 class CodeGenerator:
-    def __init__(self, api_key: str, base_url: str):
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
-        self.output_parser = PydanticOutputParser(pydantic_object=TestCaseValidationResult)
+    def __init__(self, api_key: str, base_url: str, timeout: float = LLM_TIMEOUT, use_cache: bool = True, use_hedging: bool = True):
+        # Borrowed from the shared registry so connections to the provider are reused across requests
+        self.client = client_registry.acquire(base_url, api_key)
+        self.hedge_client = None
+        if use_hedging and hedging_configured() and LLM_HEDGE_BASE_URL != base_url:
+            self.hedge_client = client_registry.acquire(LLM_HEDGE_BASE_URL, LLM_HEDGE_API_KEY)
+        self.output_parser = output_parser
+        self.base_url = base_url
+        self.timeout = timeout
+        self.use_cache = use_cache and LLM_CACHE_ENABLED
+
+    def close(self) -> None:
+        """Hand the clients back to the registry."""
+        client_registry.release(self.client)
+        if self.hedge_client is not None:
+            client_registry.release(self.hedge_client)
+
+    def cache_key(self, messages: List[Dict[str, str]], model: str) -> str:
+        messages_hash = hashlib.sha256(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return hash_key(self.base_url, model, TEMPERATURE, TOP_P, messages_hash)
 
-    def generate_response(self, prompt: str, model: str) -> str:
-        """Generate response using groq API."""
-        response = self.client.chat.completions.create(
+    async def complete(self, messages: List[Dict[str, str]], model: str, on_token: Optional[Callable[[str], None]] = None, temperature: Optional[float] = None) -> Completion:
+        """
+        Run a chat completion, reusing a cached answer to the same messages when available.
+        When on_token is given the completion is streamed and each content delta is passed to it.
+        A temperature override requests a sampled (non-deterministic) answer, which bypasses the cache.
+        """
+        started = time.perf_counter()
+        sampled = temperature is not None
+        temperature = temperature if sampled else TEMPERATURE
+        key = self.cache_key(messages, model)
+        if self.use_cache and not sampled:
+            cached = await llm_cache.get(key)
+            if cached is not None:
+                if on_token is not None:
+                    on_token(cached["content"])
+                return Completion(cached["content"], messages, input_tokens=0, latency=time.perf_counter() - started, cached=True)
+
+        secondary_model = LLM_HEDGE_MODELS.get(model) if self.hedge_client is not None else None
+        if secondary_model is None:
+            content, input_tokens = await self.send(self.client, messages, model, on_token, temperature)
+        else:
+            content, input_tokens = await self.send_hedged(messages, model, secondary_model, on_token, temperature)
+
+        if input_tokens is None:
+            input_tokens = count_tokens("".join(message["content"] for message in messages))
+
+        # Bypassing requests still refresh the cache so later requests see the newest answer
+        if LLM_CACHE_ENABLED and content and not sampled:
+            await llm_cache.set(key, {"content": content})
+        return Completion(content, messages, input_tokens=input_tokens, latency=time.perf_counter() - started)
+
+    async def generate_response(self, prompt: str, model: str, on_token: Optional[Callable[[str], None]] = None, temperature: Optional[float] = None) -> str:
+        """Generate response using groq API for a single-message prompt."""
+        completion = await self.complete([{"role": "user", "content": prompt}], model, on_token, temperature)
+        return completion.content
+
+    async def send(self, client: AsyncOpenAI, messages: List[Dict[str, str]], model: str, on_token: Optional[Callable[[str], None]], temperature: float) -> Tuple[str, Optional[int]]:
+        """Send one completion request and return its text and input token count."""
+        if on_token is not None:
+            return await self.stream_response(messages, model, on_token, temperature, client)
+        response = await client.chat.completions.create(
             model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            top_p=0.1
+            messages=messages,
+            temperature=temperature,
+            top_p=TOP_P,
+            timeout=self.timeout
         )
-        return response.choices[0].message.content
+        return response.choices[0].message.content, response.usage.prompt_tokens if response.usage else None
 
-    def generate_initial_code(self, model:str, language: str, question: str, test_cases: List[Dict[str, Any]], explanation: str) -> str:
-        """Generate initial code that reads JSON input."""
+    async def send_hedged(self, messages: List[Dict[str, str]], model: str, secondary_model: str, on_token: Optional[Callable[[str], None]], temperature: float) -> Tuple[str, Optional[int]]:
+        """
+        Send the request to the primary provider and, if it has not responded within the hedge delay,
+        to the secondary provider as well; the first to respond wins and the other is cancelled.
+        A streamed request responds with its first token, so only the winner's tokens reach on_token.
+        """
+        tracker_key = (self.base_url, model, on_token is not None)
+        started = time.perf_counter()
+        responded = asyncio.Event()
+        tasks: Dict[str, asyncio.Task] = {}
+        winner: Optional[str] = None
+
+        def claim(name: str) -> None:
+            nonlocal winner
+            if winner is not None:
+                return
+            winner = name
+            if name == "primary":
+                hedge_tracker.record(tracker_key, time.perf_counter() - started)
+            for other, task in tasks.items():
+                if other != name:
+                    task.cancel()
+            responded.set()
+
+        def forward(name: str) -> Optional[Callable[[str], None]]:
+            if on_token is None:
+                return None
+
+            def on_delta(delta: str) -> None:
+                claim(name)
+                if winner == name:
+                    on_token(delta)
+
+            return on_delta
+
+        def start(name: str, client: AsyncOpenAI, request_model: str) -> None:
+            task = asyncio.ensure_future(self.send(client, messages, request_model, forward(name), temperature))
+            # A failed attempt must not win; it only wakes the waiter
+            task.add_done_callback(lambda done: claim(name) if not done.cancelled() and done.exception() is None else responded.set())
+            tasks[name] = task
+
+        start("primary", self.client, model)
+        try:
+            try:
+                await asyncio.wait_for(responded.wait(), timeout=hedge_tracker.delay(tracker_key))
+            except asyncio.TimeoutError:
+                logger.info(f"Hedging {model} request to {secondary_model} on {LLM_HEDGE_BASE_URL}")
+                start("secondary", self.hedge_client, secondary_model)
+
+            pending = set(tasks.values())
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if winner is not None and tasks[winner].done():
+                    break
+
+            # With no winner every attempt failed; surface the primary provider's error
+            return tasks[winner or "primary"].result()
+        finally:
+            if winner != "primary":
+                # The primary took at least this long, keep the stall in its response times
+                hedge_tracker.record(tracker_key, time.perf_counter() - started)
+            hedge_tracker.record_outcome("secondary" in tasks, winner)
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    async def stream_response(self, messages: List[Dict[str, str]], model: str, on_token: Callable[[str], None], temperature: float = TEMPERATURE, client: Optional[AsyncOpenAI] = None) -> Tuple[str, Optional[int]]:
+        """Stream a completion, passing each content delta to on_token, and return the full text with its input token count."""
+        stream = await (client or self.client).chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            top_p=TOP_P,
+            timeout=self.timeout,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts = []
+        input_tokens = None
+        async for chunk in stream:
+            if chunk.usage is not None:
+                input_tokens = chunk.usage.prompt_tokens
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                on_token(delta)
+        return "".join(parts), input_tokens
+
+    def initial_messages(self, language: str, question: str, test_cases: List[Dict[str, Any]], explanation: str) -> List[Dict[str, str]]:
+        """The messages asking for initial code that reads JSON input."""
         prompt = SYSTEM_PROMPT.format(
             language=language,
             question=question,
             test_cases=json.dumps(test_cases),  # Serialize test cases to JSON
             explanation=explanation
         )
-        return self.generate_response(prompt, model)
+        return [{"role": "user", "content": prompt}]
 
-    def refine_code(self, model:str, language: str, question: str, code: str, results: str, stderror: str, compiler_errors: str, test_cases: List[Dict[str, Any]]) -> str:
-        prompt = REFINE_PROMPT.format(
+    def refine_messages(self, model: str, language: str, question: str, code: str, test_case_results: List[TestCaseResult]) -> List[Dict[str, str]]:
+        """The messages asking for a fix of the code, showing only the failing test cases within the model's prompt budget."""
+        prompt = build_refine_prompt(model, test_case_results, lambda failures, passing: REFINE_PROMPT.format(
             language=language,
             question=question,
             code=code,
-            results=results,
-            stderror=stderror,
-            compiler_errors=compiler_errors,
-            test_cases=json.dumps(test_cases)
-        )
+            test_cases=passing,
+            test_case_results=failures
+        ))
         print('refine prompt', prompt)
-        return self.generate_response(prompt, model)
-    
-    def refine_code(self, model: str, language: str, question: str, code: str, test_cases: List[Dict[str, Any]], test_case_results: List[TestCaseResult]) -> str:
-        # Convert test_case_results to a JSON string for the prompt
-        test_case_results_json = json.dumps([result.dict() for result in test_case_results])
+        return [{"role": "user", "content": prompt}]
 
-        prompt = REFINE_PROMPT.format(
-            language=language,
-            question=question,
-            code=code,
-            test_cases=json.dumps(test_cases),
-            test_case_results=test_case_results_json
-        )
-        print('refine prompt', prompt)
-        return self.generate_response(prompt, model)
+    def conversation_messages(self, model: str, conversation: List[Dict[str, str]], test_case_results: List[TestCaseResult]) -> List[Dict[str, str]]:
+        """
+        The conversation so far followed by a new turn with the latest failures. The earlier turns (problem,
+        test cases, previous answers) are resent unchanged, so providers with prefix caching only process the new turn.
+        """
+        prompt = build_refine_prompt(model, test_case_results, lambda failures, passing: CONVERSATION_REFINE_PROMPT.format(
+            test_cases=passing,
+            test_case_results=failures
+        ))
+        return conversation + [{"role": "user", "content": prompt}]
+
+    async def generate_initial_code(self, model:str, language: str, question: str, test_cases: List[Dict[str, Any]], explanation: str, on_token: Optional[Callable[[str], None]] = None, temperature: Optional[float] = None) -> Completion:
+        """Generate initial code that reads JSON input."""
+        return await self.complete(self.initial_messages(language, question, test_cases, explanation), model, on_token, temperature)
+
+    async def refine_code(self, model: str, language: str, question: str, code: str, test_case_results: List[TestCaseResult], on_token: Optional[Callable[[str], None]] = None, temperature: Optional[float] = None) -> Completion:
+        """Ask for a fix of the code."""
+        return await self.complete(self.refine_messages(model, language, question, code, test_case_results), model, on_token, temperature)
+
+    async def continue_conversation(self, model: str, conversation: List[Dict[str, str]], test_case_results: List[TestCaseResult], on_token: Optional[Callable[[str], None]] = None, temperature: Optional[float] = None) -> Completion:
+        """Ask for a fix by appending the latest failures as a new turn to the conversation so far."""
+        return await self.complete(self.conversation_messages(model, conversation, test_case_results), model, on_token, temperature)
 
-    def validate_test_cases(self, model:str, test_cases: str) -> TestCaseValidationResult:
+    async def validate_test_cases(self, model:str, test_cases: str) -> TestCaseValidationResult:
         """Validate test cases using the LLM."""
         prompt = VALIDATE_TEST_CASES_PROMPT.format(test_cases=test_cases)
-        response = self.generate_response(prompt, model)
+        response = await self.generate_response(prompt, model)
         
         # Clean the response to remove unnecessary markdown or other noise
         clean_response = re.sub(r'```(json)?\s*', '', response)
@@ -76,7 +277,7 @@ class CodeGenerator:
             logger.error(f"Failed to parse LLM response: {e}")
             raise ValueError("Failed to parse LLM response as JSON.")
 
-    def generate_test_cases(self, model: str, language: str, question: str, explanation: str, user_input: str) -> List[Dict[str, Any]]:
+    async def generate_test_cases(self, model: str, language: str, question: str, explanation: str, user_input: str) -> List[Dict[str, Any]]:
         """Generate test cases using the LLM."""
         prompt = TEST_CASE_GENERATION_PROMPT.format(
             language=language,
@@ -84,7 +285,7 @@ class CodeGenerator:
             explanation=explanation,
             example_input=user_input
         )
-        response = self.generate_response(prompt, model)
+        response = await self.generate_response(prompt, model)
         
         # Clean the response to remove unnecessary markdown or other noise
         clean_response = re.sub(r'```(json)?\s*', '', response)
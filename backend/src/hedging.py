@@ -0,0 +1,77 @@
+import json
+import math
+import os
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Optional
+
+# Hedging sends a stalled LLM request to a secondary provider as well and keeps whichever answers first.
+# It is active only when a secondary provider is configured and the model has a secondary mapping.
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_BASE_URL = os.getenv("LLM_HEDGE_BASE_URL")
+LLM_HEDGE_API_KEY = os.getenv("LLM_HEDGE_API_KEY")
+# Primary model name -> model name on the secondary provider
+LLM_HEDGE_MODELS: Dict[str, str] = json.loads(os.getenv("LLM_HEDGE_MODELS", "{}"))
+
+# The hedge fires once the primary is slower than this percentile of its recent response times
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# Delay used until enough response times have been observed
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+
+def hedging_configured() -> bool:
+    return LLM_HEDGE_ENABLED and bool(LLM_HEDGE_BASE_URL) and bool(LLM_HEDGE_API_KEY)
+
+class HedgeTracker:
+    """
+    Keeps a window of recent primary response times per (provider, model, streamed) and derives
+    the hedge delay from them. Streamed requests are timed to their first token.
+    Also counts how often hedges fire and which side wins.
+    """
+
+    def __init__(self, percentile: float = LLM_HEDGE_PERCENTILE, window: int = LLM_HEDGE_WINDOW):
+        self.percentile = percentile
+        self.window = window
+        self.samples: Dict[Hashable, Deque[float]] = {}
+        self.requests = 0
+        self.hedged = 0
+        self.secondary_wins = 0
+        self.primary_wins = 0
+
+    def record(self, key: Hashable, seconds: float) -> None:
+        self.samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, key: Hashable) -> float:
+        samples = self.samples.get(key)
+        if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT_DELAY
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, math.ceil(self.percentile * len(ordered)) - 1)
+        return max(LLM_HEDGE_MIN_DELAY, ordered[index])
+
+    def record_outcome(self, hedged: bool, winner: Optional[str]) -> None:
+        self.requests += 1
+        if not hedged:
+            return
+        self.hedged += 1
+        if winner == "secondary":
+            self.secondary_wins += 1
+        elif winner == "primary":
+            self.primary_wins += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": hedging_configured(),
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": self.hedged / self.requests if self.requests else 0.0,
+            "secondary_wins": self.secondary_wins,
+            "primary_wins": self.primary_wins,
+            "delays": {
+                f"{base_url} {model}{' (stream)' if streamed else ''}": round(self.delay((base_url, model, streamed)), 3)
+                for base_url, model, streamed in self.samples
+            },
+        }
+
+hedge_tracker = HedgeTracker()
@@ -1,13 +1,27 @@
 import streamlit as st
 import asyncio
 import logging
-from models import PipelineRequest
-from pipeline import CodeGenerationPipeline
+from models import PipelineRequest, PipelineResult, TestCase, CodeIterationHistory, QuestionPage, QuestionDetail
+from pipeline import CodeGenerationPipeline, EventCallback
+from generator import REFINEMENT_MODES, llm_cache
+from clients import client_registry
+from hedging import hedge_tracker
 from dotenv import load_dotenv
 import os
-from db import save_question, save_iteration, save_test_case_results
+import json
+import uuid
+import datetime
+from typing import Any, List, Optional
+from contextlib import asynccontextmanager
+from executor import EXECUTION_MODES, start_backend, close_backend, execution_cache, backend
+from db import save_pipeline_result, find_solved_iteration, get_test_suite, save_test_suite, list_questions, get_question
+from db_models import engine, pool_stats
+from persistence import WRITE_BEHIND_ENABLED, write_behind
+from prompt_budget import load_encoding
 import uvicorn
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 load_dotenv()
@@ -19,7 +33,21 @@ load_dotenv()
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI() # Initialize FastAPI
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Share the execution backend's pooled resources (e.g. the Judge0 HTTP client) across all requests
+    await start_backend()
+    # Load the tokenizer now so its first-use download does not block a request
+    await asyncio.to_thread(load_encoding)
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start()
+    yield
+    await write_behind.close()
+    await close_backend()
+    await client_registry.close()
+    await engine.dispose()
+
+app = FastAPI(lifespan=lifespan) # Initialize FastAPI
 
 cors_origins = os.getenv("CORS_ORIGINS", "").split(",")
 app.add_middleware(
@@ -60,77 +88,237 @@ model_ids = [
     "meta-llama/llama-4-scout-17b-16e-instruct"
 ]
 
-@app.post("/run_pipeline")
-async def run_pipeline(data: PipelineRequest):
+def validate_request(data: PipelineRequest):
+    # Validate model selection
+    if data.model not in model_ids:
+        raise HTTPException(status_code=400, detail="Invalid model selected")
+    if data.cascade and any(model not in model_ids for model in data.cascade.models):
+        raise HTTPException(status_code=400, detail="Invalid cascade model selected")
+
+    # Validate language selection
+    if data.language not in LANGUAGE_MAPPING.values():
+        raise HTTPException(status_code=400, detail="Invalid programming language")
+
+    # Validate execution mode
+    if data.execution_mode not in EXECUTION_MODES:
+        raise HTTPException(status_code=400, detail="Invalid execution mode")
+
+    # Validate refinement mode
+    if data.refinement_mode not in REFINEMENT_MODES:
+        raise HTTPException(status_code=400, detail="Invalid refinement mode")
+
+async def load_test_suite(data: PipelineRequest, model: str) -> List[TestCase]:
+    """Stored test cases previously generated for this question, or an empty list."""
+    try:
+        stored = await get_test_suite(data.language, model, data.question, data.question_code or None)
+    except Exception as e:
+        logging.error(f"Test suite lookup failed: {e}")
+        return []
+    return [TestCase(**test_case) for test_case in stored or []]
+
+async def store_test_suite(data: PipelineRequest, model: str, test_cases: List[TestCase]) -> None:
+    try:
+        await save_test_suite(data.language, model, data.question, [test_case.dict() for test_case in test_cases], data.question_code or None)
+    except Exception as e:
+        logging.error(f"Test suite write failed: {e}")
+
+def seconds(value: Optional[str]) -> Optional[float]:
+    """Execution time reported by the backend as a number, or None when it is missing or not numeric."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def iteration_row(history: CodeIterationHistory) -> dict:
+    """Columns of one iteration and its test case results, as taken by save_pipeline_result."""
+    return {
+        "iteration_number": history.iteration,
+        "chain_of_thought": history.chain_of_thought,
+        "generated_code": history.code,
+        "success": history.success,
+        "model": history.model,
+        "input_tokens": history.input_tokens,
+        "llm_latency": history.llm_latency,
+        "test_results": [
+            {
+                "input": test_result.input,
+                "expected_output": test_result.expected_output,
+                "actual_output": test_result.actual_output,
+                "execution_time": seconds(test_result.time),
+                "memory_usage": test_result.memory,
+                "stderror": test_result.stderror or "",
+                "compiler_errors": test_result.compiler_errors or "",
+                "passed": test_result.passed,
+                "skipped": test_result.skipped
+            }
+            for test_result in history.test_results
+        ]
+    }
+
+async def execute_pipeline(data: PipelineRequest, on_event: Optional[EventCallback] = None) -> PipelineResult:
+    """
+    Run the pipeline for a request, then persist the question, iterations and test case results
+    together in a single transaction. With WRITE_BEHIND_ENABLED they are queued and saved in the
+    background instead.
+    """
+    if data.provider == "groq":
+        base_url = "https://api.groq.com/openai/v1"
+    elif data.provider == "sambanova":
+        base_url = "https://api.sambanova.ai/v1"
+
+    pipeline = CodeGenerationPipeline(
+        api_key=data.api_key,
+        base_url=base_url,
+        max_iterations=data.max_iterations,
+        execution_mode=data.execution_mode,
+        max_concurrency=data.max_concurrency,
+        fail_fast=data.fail_fast,
+        use_llm_cache=data.use_llm_cache,
+        candidates=data.candidates,
+        refinement_mode=data.refinement_mode,
+        use_hedging=data.use_hedging,
+        cascade=data.cascade,
+        on_event=on_event
+    )
+
     try:
-        # Validate model selection
-        if data.model not in model_ids:
-            raise HTTPException(status_code=400, detail="Invalid model selected")
-
-        # Validate language selection
-        if data.language not in LANGUAGE_MAPPING.values():
-            raise HTTPException(status_code=400, detail="Invalid programming language")
-
-        # Save the question in the database
-        question = save_question(
-            model=data.model,
-            question_text=data.question,
-            explanation=data.explanation,
-            user_input=data.user_input,
-            language=data.language,
-            max_iterations=data.max_iterations,
-            question_code=data.question_code,
-        )
-
-        if data.provider == "groq":
-            base_url = "https://api.groq.com/openai/v1"
-        elif data.provider == "sambanova":
-            base_url = "https://api.sambanova.ai/v1"
-
-        pipeline = CodeGenerationPipeline(
-            api_key=data.api_key,
-            base_url=base_url,
-            max_iterations=data.max_iterations
-        )
+        test_cases = data.test_cases
+        if not test_cases and data.generate_test_cases and not data.regenerate_test_cases:
+            test_cases = await load_test_suite(data, pipeline.test_case_model(data.model))
+
+        # Return a previously passing solution for the same question when there is one
+        result = None
+        if data.reuse_solutions:
+            try:
+                solution = await find_solved_iteration(data.language, data.question, data.question_code or None)
+            except Exception as e:
+                logging.error(f"Solved-problem lookup failed: {e}")
+                solution = None
+            if solution is not None:
+                result = await pipeline.reuse_solution(solution, data.language, test_cases, data.user_input, verify=data.verify_reused_solution)
 
         # Run the pipeline
-        result = await pipeline.run_pipeline(
-            model=data.model,
-            language=data.language,
-            question=data.question,
-            test_cases=data.test_cases,
-            explanation=data.explanation,
-            user_input=data.user_input
-        )
-
-        # Save Iteration History in DB
-        for history in result.history:
-            iteration = save_iteration(
-                question_id=question.id,
-                iteration_number=history.iteration,
-                chain_of_thought=history.chain_of_thought,
-                generated_code=history.code,
-                success=all(test_case.passed for test_case in history.test_results)
+        if result is None:
+            result = await pipeline.run_pipeline(
+                model=data.model,
+                language=data.language,
+                question=data.question,
+                test_cases=test_cases,
+                explanation=data.explanation,
+                user_input=data.user_input
             )
+    finally:
+        pipeline.close()
+
+    # Save the question with its iterations and test case results (or queue them in write-behind mode),
+    # and the generated test suite
+    save = write_behind.submit if WRITE_BEHIND_ENABLED else save_pipeline_result
+    saving = [save(
+        {
+            "model": data.model,
+            "question": data.question,
+            "explanation": data.explanation,
+            "user_input": data.user_input,
+            "language": data.language,
+            "max_iterations": data.max_iterations,
+            "question_code": data.question_code
+        },
+        [iteration_row(history) for history in result.history]
+    )]
+    if result.generated_test_cases:
+        saving.append(store_test_suite(data, pipeline.test_case_model(data.model), result.generated_test_cases))
+    await asyncio.gather(*saving)
 
-            # Save Test Case Results for each iteration
-            for test_result in history.test_results:
-                save_test_case_results(
-                    iteration_id=iteration.id,
-                    input_data=test_result.input,
-                    expected_output=test_result.expected_output,
-                    actual_output=test_result.actual_output,
-                    execution_time=test_result.time,
-                    memory_usage=test_result.memory,
-                    stderror=test_result.stderror or "",
-                    compiler_errors=test_result.compiler_errors or "",
-                    passed=test_result.passed
-                )
+    return result
+
+@app.post("/run_pipeline")
+async def run_pipeline(data: PipelineRequest):
+    try:
+        validate_request(data)
+
+        result = await execute_pipeline(data)
 
         return {"success": True, "message": "Pipeline executed successfully", "result": result}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def format_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@app.post("/run_pipeline/stream")
+async def run_pipeline_stream(data: PipelineRequest):
+    """
+    Run the pipeline and stream progress as server-sent events: solution_reused, test_cases, token,
+    chain_of_thought, execution, test_result, candidate and iteration while it runs, then a final
+    result (or error) event.
+    """
+    validate_request(data)
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            result = await execute_pipeline(data, on_event=lambda event, payload: events.put_nowait((event, payload)))
+            events.put_nowait(("result", {"success": True, "message": "Pipeline executed successfully", "result": result}))
+        except Exception as e:
+            logging.exception("Streaming pipeline failed")
+            events.put_nowait(("error", {"detail": str(e)}))
+        finally:
+            events.put_nowait(None)
+
+    async def stream():
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await events.get()) is not None:
+                yield format_event(*item)
+        finally:
+            # The client went away before the pipeline finished
+            if not producer.done():
+                producer.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/questions")
+async def questions(
+    model: Optional[str] = None,
+    language: Optional[str] = None,
+    question_code: Optional[str] = None,
+    created_after: Optional[datetime.datetime] = None,
+    created_before: Optional[datetime.datetime] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """List stored questions, newest first. Pass the returned next_cursor as cursor for the next page."""
+    try:
+        summaries, next_cursor = await list_questions(model, language, question_code, created_after, created_before, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return QuestionPage(questions=summaries, next_cursor=next_cursor)
+
+@app.get("/questions/{question_id}")
+async def question(question_id: uuid.UUID):
+    """A stored question with its iterations and their test case results."""
+    stored = await get_question(question_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Question not found")
+    return QuestionDetail(**stored)
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "execution_cache": execution_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_clients": client_registry.stats(),
+        "llm_hedging": hedge_tracker.stats(),
+        "execution_backend": {"name": backend.name, **backend.stats()},
+        "db_pool": pool_stats(),
+        "write_behind": write_behind.stats(),
+    }
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
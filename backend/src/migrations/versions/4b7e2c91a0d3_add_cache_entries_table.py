@@ -0,0 +1,38 @@
+"""Add cache_entries table
+
+Revision ID: 4b7e2c91a0d3
+Revises: d9476bfdd09b
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b7e2c91a0d3'
+down_revision: Union[str, None] = 'd9476bfdd09b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('cache_entries',
+    sa.Column('namespace', sa.String(length=50), nullable=False),
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('value', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('namespace', 'key')
+    )
+    op.create_index(op.f('ix_cache_entries_expires_at'), 'cache_entries', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_cache_entries_expires_at'), table_name='cache_entries')
+    op.drop_table('cache_entries')
@@ -0,0 +1,28 @@
+"""Add model to iterations
+
+Revision ID: 5f2b9e07c1a8
+Revises: e3a8d41c6f57
+Create Date: 2026-10-18 15:48:09.617224
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f2b9e07c1a8'
+down_revision: Union[str, None] = 'e3a8d41c6f57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('iterations', sa.Column('model', sa.String(length=255), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('iterations', 'model')
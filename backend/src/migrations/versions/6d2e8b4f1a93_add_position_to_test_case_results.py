@@ -0,0 +1,29 @@
+"""Add position to test_case_results
+
+Revision ID: 6d2e8b4f1a93
+Revises: f1c7a9d2b365
+Create Date: 2026-10-18 16:42:08.213674
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6d2e8b4f1a93'
+down_revision: Union[str, None] = 'f1c7a9d2b365'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Rows saved before this revision did not record their order and keep a null position
+    op.add_column('test_case_results', sa.Column('position', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('test_case_results', 'position')
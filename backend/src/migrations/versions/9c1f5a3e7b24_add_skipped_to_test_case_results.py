@@ -0,0 +1,28 @@
+"""Add skipped to test_case_results
+
+Revision ID: 9c1f5a3e7b24
+Revises: 4b7e2c91a0d3
+Create Date: 2026-10-18 11:02:17.540913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1f5a3e7b24'
+down_revision: Union[str, None] = '4b7e2c91a0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('test_case_results', sa.Column('skipped', sa.Boolean(), server_default=sa.text('false'), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('test_case_results', 'skipped')
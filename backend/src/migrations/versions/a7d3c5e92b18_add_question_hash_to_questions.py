@@ -0,0 +1,60 @@
+"""Add question_hash to questions
+
+Revision ID: a7d3c5e92b18
+Revises: 5f2b9e07c1a8
+Create Date: 2026-10-18 16:37:52.204716
+
+"""
+from typing import Sequence, Union
+import hashlib
+import re
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d3c5e92b18'
+down_revision: Union[str, None] = '5f2b9e07c1a8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+
+
+def question_hash(question):
+    """Same normalization as db.question_hash."""
+    normalized = re.sub(r"\s+", " ", (question or "").strip().lower())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('questions', sa.Column('question_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_questions_question_hash'), 'questions', ['question_hash'], unique=False)
+    op.create_index(op.f('ix_questions_question_code'), 'questions', ['question_code'], unique=False)
+
+    # Backfill in id order, one executemany per BATCH_SIZE rows
+    connection = op.get_bind()
+    questions = sa.table('questions', sa.column('id', postgresql.UUID()), sa.column('question'), sa.column('question_hash'))
+    last_id = None
+    while True:
+        query = sa.select(questions.c.id, questions.c.question).order_by(questions.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(questions.c.id > last_id)
+        rows = connection.execute(query).all()
+        if not rows:
+            break
+        connection.execute(
+            questions.update().where(questions.c.id == sa.bindparam('row_id')).values(question_hash=sa.bindparam('new_question_hash')),
+            [{'row_id': row.id, 'new_question_hash': question_hash(row.question)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_questions_question_code'), table_name='questions')
+    op.drop_index(op.f('ix_questions_question_hash'), table_name='questions')
+    op.drop_column('questions', 'question_hash')
@@ -0,0 +1,36 @@
+"""Add history query indexes
+
+Revision ID: b8f2d6a41e07
+Revises: c4e6f18a3d92
+Create Date: 2026-10-18 19:42:13.508217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8f2d6a41e07'
+down_revision: Union[str, None] = 'c4e6f18a3d92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_iterations_question_id'), 'iterations', ['question_id'], unique=False)
+    op.create_index(op.f('ix_test_case_results_iteration_id'), 'test_case_results', ['iteration_id'], unique=False)
+    op.create_index('ix_questions_created_at_id', 'questions', ['created_at', 'id'], unique=False)
+    op.create_index('ix_questions_model_created_at_id', 'questions', ['model', 'created_at', 'id'], unique=False)
+    op.create_index('ix_questions_language_created_at_id', 'questions', ['language', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_questions_language_created_at_id', table_name='questions')
+    op.drop_index('ix_questions_model_created_at_id', table_name='questions')
+    op.drop_index('ix_questions_created_at_id', table_name='questions')
+    op.drop_index(op.f('ix_test_case_results_iteration_id'), table_name='test_case_results')
+    op.drop_index(op.f('ix_iterations_question_id'), table_name='iterations')
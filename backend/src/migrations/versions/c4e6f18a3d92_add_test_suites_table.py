@@ -0,0 +1,41 @@
+"""Add test_suites table
+
+Revision ID: c4e6f18a3d92
+Revises: a7d3c5e92b18
+Create Date: 2026-10-18 17:21:06.349871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e6f18a3d92'
+down_revision: Union[str, None] = 'a7d3c5e92b18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('test_suites',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('question_key', sa.String(length=255), nullable=False),
+    sa.Column('language', sa.String(length=50), nullable=False),
+    sa.Column('model', sa.String(length=255), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('test_cases', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('question_key', 'language', 'model', 'content_hash')
+    )
+    op.create_index('ix_test_suites_lookup', 'test_suites', ['question_key', 'language', 'model', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_test_suites_lookup', table_name='test_suites')
+    op.drop_table('test_suites')
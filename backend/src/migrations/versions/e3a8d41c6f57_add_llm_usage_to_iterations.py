@@ -0,0 +1,30 @@
+"""Add LLM usage to iterations
+
+Revision ID: e3a8d41c6f57
+Revises: 9c1f5a3e7b24
+Create Date: 2026-10-18 14:26:41.183502
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3a8d41c6f57'
+down_revision: Union[str, None] = '9c1f5a3e7b24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('iterations', sa.Column('input_tokens', sa.Integer(), nullable=True))
+    op.add_column('iterations', sa.Column('llm_latency', sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('iterations', 'llm_latency')
+    op.drop_column('iterations', 'input_tokens')
@@ -0,0 +1,155 @@
+"""Move large texts to blobs
+
+Revision ID: f1c7a9d2b365
+Revises: b8f2d6a41e07
+Create Date: 2026-10-18 21:06:37.190452
+
+"""
+import hashlib
+import zlib
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a9d2b365'
+down_revision: Union[str, None] = 'b8f2d6a41e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Columns moved to blobs, per table: text column -> hash column
+BLOB_COLUMNS = {
+    'iterations': {'generated_code': 'generated_code_hash'},
+    'test_case_results': {
+        'input': 'input_hash',
+        'expected_output': 'expected_output_hash',
+        'actual_output': 'actual_output_hash',
+        'stderror': 'stderror_hash',
+    },
+}
+BATCH_SIZE = 1000
+# The backfill always uses zlib so it does not depend on the optional zstandard package
+COMPRESSION_THRESHOLD = 512
+
+blobs = sa.table(
+    'blobs',
+    sa.column('hash', sa.String),
+    sa.column('encoding', sa.String),
+    sa.column('data', sa.LargeBinary),
+    sa.column('size', sa.Integer),
+)
+
+
+def encode(text):
+    raw = text.encode('utf-8')
+    encoding, data = 'raw', raw
+    if len(raw) >= COMPRESSION_THRESHOLD:
+        compressed = zlib.compress(raw)
+        if len(compressed) < len(raw):
+            encoding, data = 'zlib', compressed
+    return {'hash': hashlib.sha256(raw).hexdigest(), 'encoding': encoding, 'data': data, 'size': len(raw)}
+
+
+def decode(encoding, data):
+    if encoding == 'zstd':
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif encoding == 'zlib':
+        data = zlib.decompress(data)
+    return bytes(data).decode('utf-8')
+
+
+def batches(connection, table, columns):
+    """Yield the rows of a table in id order, BATCH_SIZE at a time."""
+    last_id = None
+    while True:
+        query = sa.select(table.c.id, *(table.c[column] for column in columns)).order_by(table.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = connection.execute(query).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('encoding', sa.String(length=10), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    for table_name, columns in BLOB_COLUMNS.items():
+        for hash_column in columns.values():
+            op.add_column(table_name, sa.Column(hash_column, sa.String(length=64), nullable=True))
+
+    # Backfill: store each distinct text once and point the rows at it
+    connection = op.get_bind()
+    for table_name, columns in BLOB_COLUMNS.items():
+        table = sa.table(table_name, sa.column('id', postgresql.UUID()), *(sa.column(column) for column in columns), *(sa.column(column) for column in columns.values()))
+        for rows in batches(connection, table, list(columns)):
+            blob_rows = {}
+            updates = []
+            for row in rows:
+                update = {'row_id': row.id}
+                for text_column, hash_column in columns.items():
+                    text = getattr(row, text_column)
+                    if text is None:
+                        update[f'new_{hash_column}'] = None
+                        continue
+                    blob = encode(text)
+                    blob_rows[blob['hash']] = blob
+                    update[f'new_{hash_column}'] = blob['hash']
+                updates.append(update)
+            if blob_rows:
+                connection.execute(
+                    postgresql.insert(blobs).on_conflict_do_nothing(index_elements=['hash']),
+                    [blob_rows[key] for key in sorted(blob_rows)]
+                )
+            connection.execute(
+                table.update().where(table.c.id == sa.bindparam('row_id')).values({hash_column: sa.bindparam(f'new_{hash_column}') for hash_column in columns.values()}),
+                updates
+            )
+
+    for table_name, columns in BLOB_COLUMNS.items():
+        for text_column, hash_column in columns.items():
+            op.create_foreign_key(f'{table_name}_{hash_column}_fkey', table_name, 'blobs', [hash_column], ['hash'])
+            op.drop_column(table_name, text_column)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table_name, columns in BLOB_COLUMNS.items():
+        for text_column in columns:
+            op.add_column(table_name, sa.Column(text_column, sa.TEXT(), autoincrement=False, nullable=True))
+
+    # Restore the texts from their blobs
+    connection = op.get_bind()
+    for table_name, columns in BLOB_COLUMNS.items():
+        table = sa.table(table_name, sa.column('id', postgresql.UUID()), *(sa.column(column) for column in columns), *(sa.column(column) for column in columns.values()))
+        for rows in batches(connection, table, list(columns.values())):
+            hashes = {getattr(row, hash_column) for row in rows for hash_column in columns.values()} - {None}
+            texts = {
+                blob.hash: decode(blob.encoding, blob.data)
+                for blob in connection.execute(sa.select(blobs).where(blobs.c.hash.in_(hashes)))
+            } if hashes else {}
+            connection.execute(
+                table.update().where(table.c.id == sa.bindparam('row_id')).values({text_column: sa.bindparam(f'new_{text_column}') for text_column in columns}),
+                [
+                    {'row_id': row.id, **{f'new_{text_column}': texts.get(getattr(row, hash_column)) for text_column, hash_column in columns.items()}}
+                    for row in rows
+                ]
+            )
+
+    for table_name, columns in BLOB_COLUMNS.items():
+        for hash_column in columns.values():
+            op.drop_constraint(f'{table_name}_{hash_column}_fkey', table_name, type_='foreignkey')
+            op.drop_column(table_name, hash_column)
+    op.drop_table('blobs')
@@ -1,5 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
+import datetime
+import uuid
 
 class TestCaseResult(BaseModel):
     input: str = Field(description="Input for the test case")
@@ -10,6 +12,7 @@ class TestCaseResult(BaseModel):
     time: str = Field(description="The time taken for code execution")
     memory: int = Field(description="The memory used during code execution")
     passed: bool = Field(description="Whether the test case passed")
+    skipped: bool = Field(default=False, description="Whether the test case was not run because the fail-fast policy stopped execution")
 
 class TestCaseValidationResult(BaseModel):
     test_results: List[TestCaseResult] = Field(description="List of test case validation results")
@@ -24,6 +27,7 @@ class CodeExecutionResult(BaseModel):
     memory: int = Field(description="The memory used during code execution")
     stderror: str = Field(description="The error message if a runtime error occurred during execution")
     compiler_errors: str = Field(description="The compiler errors if any occurred during compilation")
+    status: Optional[str] = Field(default=None, description="The execution status reported by the executor (e.g. Accepted, Time Limit Exceeded)")
 
 class CodeIterationHistory(BaseModel):
     iteration: int = Field(description="The iteration number")
@@ -31,6 +35,16 @@ class CodeIterationHistory(BaseModel):
     code: str = Field(description="The generated or refined code")
     execution_result: CodeExecutionResult = Field(description="The result of the code execution")
     test_results: List[TestCaseResult] = Field(description="Results of test case validation")
+    candidate: int = Field(default=0, description="Index of the best-of-N candidate kept for this iteration")
+    model: Optional[str] = Field(default=None, description="The model that generated this iteration's code")
+    input_tokens: Optional[int] = Field(default=None, description="Prompt tokens sent to the LLM for this iteration's code")
+    llm_latency: Optional[float] = Field(default=None, description="Seconds spent waiting for this iteration's code from the LLM")
+    success: bool = Field(default=False, description="Whether this iteration's code passed at least one test case and failed none")
+
+class StageTiming(BaseModel):
+    name: str = Field(description="The pipeline stage, e.g. test_cases, draft, generate:2 or execute:2")
+    start: float = Field(description="Seconds from the start of the pipeline until the stage started")
+    duration: float = Field(description="Seconds the stage took")
 
 class PipelineResult(BaseModel):
     cot: List[str] = Field(description="The chain of thought as a list of reasoning steps")
@@ -40,6 +54,17 @@ class PipelineResult(BaseModel):
     iterations: int = Field(description="Total number of iterations")
     history: List[CodeIterationHistory] = Field(description="History of all iterations")
     success: bool = Field(description="Whether the pipeline was successful")
+    reused: bool = Field(default=False, description="Whether the code is a previously passing solution instead of a new generation")
+    generated_test_cases: Optional[List[TestCase]] = Field(default=None, description="The test cases generated for this run, if none were given")
+    stage_timings: List[StageTiming] = Field(default=[], description="When each pipeline stage started and how long it took")
+
+class CascadePolicy(BaseModel):
+    models: List[str] = Field(min_length=1, description="Cheaper models tried first, smallest first; the request's model is the last step")
+    escalate_after: int = Field(default=1, ge=1, description="Failed iterations on a model before escalating to the next one")
+
+class FailFastPolicy(BaseModel):
+    on_compile_error: bool = Field(default=True, description="Stop running test cases as soon as a run reports compiler errors")
+    max_failures: Optional[int] = Field(default=None, ge=1, description="Stop running test cases after this many failures")
 
 class PipelineRequest(BaseModel):
     provider: str
@@ -50,6 +75,57 @@ class PipelineRequest(BaseModel):
     user_input: Optional[str] = None
     max_iterations: int = 3
     generate_test_cases: bool = True
+    regenerate_test_cases: bool = False
     test_cases: Optional[List[TestCase]] = []
     api_key: str
-    question_code: Optional[str] = None
\ No newline at end of file
+    question_code: Optional[str] = None
+    execution_mode: str = "batch"
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+    fail_fast: Optional[FailFastPolicy] = None
+    cascade: Optional[CascadePolicy] = None
+    use_llm_cache: bool = True
+    use_hedging: bool = True
+    reuse_solutions: bool = True
+    verify_reused_solution: bool = True
+    candidates: int = Field(default=1, ge=1, le=5)
+    refinement_mode: str = "prompt"
+
+class StoredTestCaseResult(BaseModel):
+    input: Optional[str] = Field(default=None, description="Input for the test case")
+    expected_output: Optional[str] = Field(default=None, description="Expected output for the test case")
+    actual_output: Optional[str] = Field(default=None, description="Actual output from the code execution")
+    execution_time: Optional[float] = Field(default=None, description="Seconds the execution took")
+    memory_usage: Optional[int] = Field(default=None, description="The memory used during code execution")
+    stderror: Optional[str] = Field(default=None, description="The error message if a runtime error occurred during execution")
+    compiler_errors: Optional[str] = Field(default=None, description="The compiler errors if any occurred during compilation")
+    passed: Optional[bool] = Field(default=None, description="Whether the test case passed")
+    skipped: Optional[bool] = Field(default=None, description="Whether the test case was skipped by the fail-fast policy")
+
+class StoredIteration(BaseModel):
+    id: uuid.UUID
+    iteration_number: int = Field(description="The iteration number")
+    chain_of_thought: List[str] = Field(default=[], description="The chain of thought for this iteration")
+    generated_code: Optional[str] = Field(default=None, description="The generated or refined code")
+    success: Optional[bool] = Field(default=None, description="Whether every test case passed")
+    model: Optional[str] = Field(default=None, description="The model that generated this iteration's code")
+    input_tokens: Optional[int] = Field(default=None, description="Prompt tokens sent to the LLM for this iteration's code")
+    llm_latency: Optional[float] = Field(default=None, description="Seconds spent waiting for this iteration's code from the LLM")
+    test_results: List[StoredTestCaseResult] = Field(default=[], description="Results of the test cases")
+
+class QuestionSummary(BaseModel):
+    id: uuid.UUID
+    model: Optional[str] = None
+    question: Optional[str] = None
+    language: Optional[str] = None
+    question_code: Optional[str] = None
+    max_iterations: Optional[int] = None
+    created_at: Optional[datetime.datetime] = None
+
+class QuestionDetail(QuestionSummary):
+    explanation: Optional[str] = None
+    user_input: Optional[str] = None
+    iterations: List[StoredIteration] = Field(default=[], description="Stored iterations in order")
+
+class QuestionPage(BaseModel):
+    questions: List[QuestionSummary] = Field(description="Questions, newest first")
+    next_cursor: Optional[str] = Field(default=None, description="Pass as cursor to fetch the next page; None on the last page")
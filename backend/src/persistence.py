@@ -0,0 +1,320 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import save_pipeline_results
+
+logger = logging.getLogger(__name__)
+
+# Write-behind mode: pipeline results are queued and saved by a background worker in batches
+# across requests, so /run_pipeline returns without waiting for the database
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "1000"))
+# A batch is flushed once it holds this many runs or its first run has waited this many seconds
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "50"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0"))
+# Runs that could not be saved are spooled to a per-process file in this directory (a persistent volume)
+# and saved again at most every WRITE_BEHIND_RETRY_INTERVAL seconds
+WRITE_BEHIND_SPOOL_DIR = os.path.abspath(os.getenv("WRITE_BEHIND_SPOOL_DIR", "/var/lib/codecraft/write_behind"))
+WRITE_BEHIND_RETRY_INTERVAL = float(os.getenv("WRITE_BEHIND_RETRY_INTERVAL", "30"))
+# On shutdown, queued runs are flushed for at most this many seconds; the rest are spooled
+WRITE_BEHIND_DRAIN_TIMEOUT = float(os.getenv("WRITE_BEHIND_DRAIN_TIMEOUT", "10"))
+
+SPOOL_NAME = re.compile(r"write_behind-(\d+)\.spool(\.replay)?")
+
+# (question, iterations) as taken by db.save_pipeline_results
+Run = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+@dataclass
+class PendingRun:
+    run: Run
+    enqueued_at: float
+
+def dump_run(run: Run) -> str:
+    question, iterations = run
+    return json.dumps({"question": question, "iterations": iterations}, default=str)
+
+def append_lines(path: str, lines: List[str]) -> None:
+    with open(path, "a", encoding="utf-8") as file:
+        file.writelines(lines)
+        file.flush()
+        os.fsync(file.fileno())
+
+def process_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def orphaned_spools(directory: str) -> List[str]:
+    """Spool and replay files in the directory whose worker process is no longer running."""
+    orphans = []
+    for name in sorted(os.listdir(directory)):
+        match = SPOOL_NAME.fullmatch(name)
+        if match is None:
+            continue
+        pid = int(match.group(1))
+        if pid != os.getpid() and not process_running(pid):
+            orphans.append(os.path.join(directory, name))
+    return orphans
+
+def load_run(line: str) -> Run:
+    data = json.loads(line)
+    question = data["question"]
+    question["id"] = uuid.UUID(question["id"])
+    question["created_at"] = datetime.datetime.fromisoformat(question["created_at"])
+    return question, data["iterations"]
+
+class WriteBehindQueue:
+    """
+    Bounded queue of pipeline runs drained by a background worker. The worker saves runs in batches,
+    one transaction per batch, falling back to one transaction per run when a batch is rejected.
+    Runs that could not be saved are spooled (by default to a per-process file in WRITE_BEHIND_SPOOL_DIR)
+    and replayed once the database accepts writes again; saving is idempotent, so replays never duplicate rows.
+    """
+
+    def __init__(
+        self,
+        max_size: int = WRITE_BEHIND_QUEUE_SIZE,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        spool_path: Optional[str] = None
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_path = spool_path
+        # Serializes the spool writers with the replay moving the spool aside
+        self.spool_lock = asyncio.Lock()
+        self.queue: Optional["asyncio.Queue[PendingRun]"] = None
+        self.worker: Optional[asyncio.Task] = None
+        # The batch the worker has taken off the queue and not finished with yet
+        self.in_flight: List[PendingRun] = []
+        self.last_replay = 0.0
+        self.enqueued = 0
+        self.saved = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.max_queue_seconds = 0.0
+
+    def start(self) -> None:
+        if self.spool_path is None:
+            os.makedirs(WRITE_BEHIND_SPOOL_DIR, exist_ok=True)
+            self.spool_path = os.path.join(WRITE_BEHIND_SPOOL_DIR, f"write_behind-{os.getpid()}.spool")
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.worker = asyncio.ensure_future(self.run())
+
+    async def close(self) -> None:
+        """
+        Flush the queued runs and stop the worker. Waits at most WRITE_BEHIND_DRAIN_TIMEOUT seconds, and not
+        at all if the worker has died; the runs still queued or in flight then are spooled instead.
+        """
+        if self.worker is None:
+            return
+        if not self.worker.done():
+            drained = asyncio.ensure_future(self.queue.join())
+            done, _ = await asyncio.wait({drained, self.worker}, timeout=WRITE_BEHIND_DRAIN_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+            drained.cancel()
+            if drained not in done:
+                logger.warning(f"Write-behind queue not drained within {WRITE_BEHIND_DRAIN_TIMEOUT}s, spooling the rest")
+        self.worker.cancel()
+        await asyncio.gather(self.worker, return_exceptions=True)
+        self.worker = None
+
+        # Saving is idempotent, so spooling an in-flight batch that did get saved is harmless
+        remaining = [pending.run for pending in self.in_flight]
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait().run)
+            self.queue.task_done()
+        self.in_flight = []
+        if remaining:
+            await self.spool(remaining)
+
+    async def submit(self, question: Dict[str, Any], iterations: List[Dict[str, Any]]) -> uuid.UUID:
+        """Queue a run for saving and return its question id; a run that does not fit is spooled instead."""
+        question = {**question, "id": uuid.uuid4(), "created_at": datetime.datetime.now(datetime.timezone.utc)}
+        run = (question, iterations)
+        self.enqueued += 1
+        try:
+            self.queue.put_nowait(PendingRun(run, time.monotonic()))
+        except asyncio.QueueFull:
+            logger.warning("Write-behind queue is full, spooling the run")
+            await self.spool([run])
+        return question["id"]
+
+    async def run(self) -> None:
+        await self.replay()
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = self.in_flight = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                saved = await self.flush(batch)
+                self.in_flight = []
+                if saved and time.monotonic() - self.last_replay >= WRITE_BEHIND_RETRY_INTERVAL:
+                    await self.replay()
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def save(self, runs: List[Run]) -> List[Run]:
+        """
+        Save runs in one transaction, or one transaction per run if that fails, so a single bad run
+        does not hold back the others. Returns the runs that could not be saved.
+        """
+        try:
+            await save_pipeline_results(runs)
+            return []
+        except Exception as e:
+            if len(runs) == 1:
+                logger.error(f"Saving run {runs[0][0]['id']} failed: {e}")
+                return runs
+            logger.error(f"Saving {len(runs)} runs together failed, saving them one at a time: {e}")
+
+        failed = []
+        for run in runs:
+            try:
+                await save_pipeline_results([run])
+            except Exception as e:
+                logger.error(f"Saving run {run[0]['id']} failed: {e}")
+                failed.append(run)
+        return failed
+
+    async def flush(self, batch: List[PendingRun]) -> bool:
+        """Save a batch and spool the runs that could not be saved. Returns whether any run was saved."""
+        now = time.monotonic()
+        self.max_queue_seconds = max(self.max_queue_seconds, now - batch[0].enqueued_at)
+        runs = [pending.run for pending in batch]
+        failed = await self.save(runs)
+        if failed:
+            await self.spool(failed)
+        if len(failed) == len(runs):
+            self.failed_flushes += 1
+            return False
+
+        elapsed = time.monotonic() - now
+        self.flushes += 1
+        self.saved += len(runs) - len(failed)
+        self.flush_seconds += elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        return True
+
+    async def spool(self, runs: List[Run]) -> None:
+        try:
+            async with self.spool_lock:
+                await asyncio.to_thread(append_lines, self.spool_path, [dump_run(run) + "\n" for run in runs])
+            self.spooled += len(runs)
+        except OSError as e:
+            logger.error(f"Failed to spool {len(runs)} runs to {self.spool_path}: {e}")
+
+    async def replay(self) -> None:
+        """
+        Save spooled runs, together with the spools of workers that are no longer running. The spool is
+        moved aside first so new failures append to a fresh file. If no run can be saved, the database is
+        taken to be down and the moved file is kept for the next replay; otherwise runs that still fail,
+        and lines that cannot be read back, go to the .dead file next to the spool.
+        """
+        self.last_replay = time.monotonic()
+        replaying = self.spool_path + ".replay"
+
+        def take() -> Tuple[List[Run], List[str]]:
+            # Two workers adopting the same orphan both replay it, which saving idempotently allows
+            for orphan in orphaned_spools(os.path.dirname(self.spool_path) or "."):
+                try:
+                    with open(orphan, encoding="utf-8") as spool:
+                        append_lines(replaying, spool.readlines())
+                    os.remove(orphan)
+                except FileNotFoundError:
+                    continue
+                logger.info(f"Adopted the write-behind spool {orphan}")
+            if os.path.exists(self.spool_path):
+                if os.path.exists(replaying):
+                    with open(self.spool_path, encoding="utf-8") as spool:
+                        append_lines(replaying, spool.readlines())
+                    os.remove(self.spool_path)
+                else:
+                    os.replace(self.spool_path, replaying)
+            if not os.path.exists(replaying):
+                return [], []
+
+            runs, unreadable = [], []
+            with open(replaying, encoding="utf-8") as spool:
+                for line in spool:
+                    if not line.strip():
+                        continue
+                    try:
+                        runs.append(load_run(line))
+                    except (ValueError, KeyError, TypeError) as e:
+                        logger.error(f"Unreadable spooled run: {e!r}")
+                        unreadable.append(line)
+            return runs, unreadable
+
+        try:
+            async with self.spool_lock:
+                runs, unreadable = await asyncio.to_thread(take)
+        except OSError as e:
+            logger.error(f"Failed to read the write-behind spool: {e}")
+            return
+        if not runs and not unreadable:
+            return
+
+        failed = []
+        for start in range(0, len(runs), self.batch_size):
+            failed += await self.save(runs[start:start + self.batch_size])
+        if runs and len(failed) == len(runs):
+            logger.error(f"Replaying {len(runs)} spooled runs failed, keeping them for the next replay")
+            return
+
+        dead = unreadable + [dump_run(run) + "\n" for run in failed]
+        try:
+            if dead:
+                await asyncio.to_thread(append_lines, self.spool_path + ".dead", dead)
+            await asyncio.to_thread(os.remove, replaying)
+        except OSError as e:
+            logger.error(f"Failed to clear the replayed spool: {e}")
+        self.replayed += len(runs) - len(failed)
+        self.dead_lettered += len(dead)
+        logger.info(f"Replayed {len(runs) - len(failed)} spooled runs, {len(dead)} moved to the dead-letter file")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.worker is not None,
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_size": self.max_size,
+            "enqueued": self.enqueued,
+            "saved": self.saved,
+            "spooled": self.spooled,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "flush_avg_ms": round(1000 * self.flush_seconds / self.flushes, 3) if self.flushes else 0.0,
+            "flush_max_ms": round(1000 * self.max_flush_seconds, 3),
+            "queue_max_ms": round(1000 * self.max_queue_seconds, 3),
+        }
+
+write_behind = WriteBehindQueue()
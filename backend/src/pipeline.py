@@ -1,19 +1,96 @@
+import asyncio
 import httpx
-import re
+import os
 import logging
-from typing import List, Dict, Any
-from models import CodeIterationHistory, PipelineResult, TestCase, TestCaseResult, CodeExecutionResult
-from executor import execute_code
-from generator import CodeGenerator
-import json
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Dict, Any, Optional
+from models import CodeIterationHistory, PipelineResult, TestCase, TestCaseResult, CodeExecutionResult, FailFastPolicy, CascadePolicy
+from executor import execute_many, is_cacheable, request_semaphore
+from backends import StopCondition, empty_result
+from generator import CodeGenerator, Completion, CANDIDATE_TEMPERATURE
+from prompt_budget import count_tokens
+from stages import StageGraph
+from response_parser import StreamingResponseParser, parse_response
 
 logger = logging.getLogger(__name__)
 
+# Stream every code generation and start executing as soon as the code block is complete,
+# while the rest of the response is still arriving
+EARLY_EXECUTION = os.getenv("EARLY_EXECUTION", "true").lower() == "true"
+
+# Receives (event name, JSON-serializable payload) for progress updates while the pipeline runs
+EventCallback = Callable[[str, Dict[str, Any]], None]
+
+@dataclass
+class Candidate:
+    """One generated solution of an iteration together with its execution results."""
+    index: int
+    cot: List[str]
+    code: str
+    execution_result: CodeExecutionResult
+    test_case_results: List[TestCaseResult]
+    completion: Completion
+
+    @property
+    def passed(self) -> int:
+        return sum(test_case.passed for test_case in self.test_case_results)
+
+    @property
+    def success(self) -> bool:
+        return all(test_case.passed for test_case in self.test_case_results)
+
+@dataclass
+class Generation:
+    """
+    A code generation in flight: the task producing the full completion, and a future that receives
+    (chain_of_thought, code) as soon as the code block has streamed in.
+    """
+    completion: "asyncio.Future[Completion]"
+    code: "asyncio.Future[Any]"
+    parser: StreamingResponseParser
+    messages: List[Dict[str, str]]
+    started: float
+
+    def partial(self) -> Completion:
+        """The completion built from the text streamed so far, for when the rest of the response is not awaited."""
+        return Completion(
+            self.parser.text,
+            self.messages,
+            input_tokens=count_tokens("".join(message["content"] for message in self.messages)),
+            latency=time.perf_counter() - self.started
+        )
+
 class CodeGenerationPipeline:
-    def __init__(self, api_key: str, base_url: str, max_iterations: int = 3):
-        self.generator = CodeGenerator(api_key=api_key, base_url=base_url)
+    def __init__(self, api_key: str, base_url: str, max_iterations: int = 3, execution_mode: str = "batch", max_concurrency: Optional[int] = None, fail_fast: Optional[FailFastPolicy] = None, use_llm_cache: bool = True, candidates: int = 1, refinement_mode: str = "prompt", use_hedging: bool = True, cascade: Optional[CascadePolicy] = None, on_event: Optional[EventCallback] = None):
+        self.generator = CodeGenerator(api_key=api_key, base_url=base_url, use_cache=use_llm_cache, use_hedging=use_hedging)
+        self.on_event = on_event
+        self.stages = StageGraph()
         self.max_iterations = max_iterations
+        self.execution_mode = execution_mode
+        # Shared by every execution of this request, so concurrent candidates stay within max_concurrency together
+        self.execution_semaphore = request_semaphore(max_concurrency)
+        self.fail_fast = fail_fast
+        self.candidates = candidates
+        self.refinement_mode = refinement_mode
+        self.cascade = cascade
     
+    def close(self) -> None:
+        self.generator.close()
+
+    def cascade_models(self, model: str) -> List[str]:
+        """The models to use in order; without a cascade policy only the requested model."""
+        if self.cascade is None:
+            return [model]
+        return [step for step in self.cascade.models if step != model] + [model]
+
+    def model_for_iteration(self, iteration: int, model: str) -> str:
+        """Pick the cascade step for a 1-based iteration, escalating after every escalate_after failed iterations."""
+        if self.cascade is None:
+            return model
+        models = self.cascade_models(model)
+        return models[min((iteration - 1) // self.cascade.escalate_after, len(models) - 1)]
+
     def normalize_array_string(self, s: str) -> str:
         """Normalize array string by removing spaces between elements, preserving structure."""
         if not (s.startswith("[") and s.endswith("]")):
@@ -42,27 +119,370 @@ class CodeGenerationPipeline:
                 
         return ''.join(result)
     
+    def output_matches(self, actual_output: str, expected_output: Optional[str]) -> bool:
+        """Compare actual and expected output, ignoring case and spacing inside arrays."""
+        actual = actual_output.strip()
+        expected = expected_output.strip() if expected_output else ""
+
+        return (
+            actual == expected or 
+            actual.lower() == expected.lower() or
+            self.normalize_array_string(actual) == self.normalize_array_string(expected) or
+            self.normalize_array_string(actual.lower()) == self.normalize_array_string(expected.lower())
+        ) if expected else False
+
+    def fail_fast_condition(self, test_cases: List[TestCase]) -> Optional[StopCondition]:
+        """
+        Build the stop condition for an iteration's executions from the fail-fast policy.
+        Index 0 is the user_input run, index i the (i - 1)th test case.
+        """
+        policy = self.fail_fast
+        if policy is None:
+            return None
+
+        failures = 0
+
+        def should_stop(index: int, result: CodeExecutionResult) -> bool:
+            nonlocal failures
+            if policy.on_compile_error and result.compiler_errors:
+                return True
+            if index == 0 or policy.max_failures is None:
+                return False
+            if not self.output_matches(result.output, test_cases[index - 1].expected_output):
+                failures += 1
+            return failures >= policy.max_failures
+
+        return should_stop
+
+    def emit(self, event: str, data: Dict[str, Any]) -> None:
+        if self.on_event is not None:
+            self.on_event(event, data)
+
+    def token_callback(self, iteration: int) -> Optional[Callable[[str], None]]:
+        """Forward streamed LLM tokens for the given iteration as events."""
+        if self.on_event is None:
+            return None
+        return lambda content: self.emit("token", {"iteration": iteration, "content": content})
+
+    def execution_callback(self, iteration: int, test_cases: List[TestCase]) -> Optional[StopCondition]:
+        """Emit each execution result as it arrives and apply the fail-fast policy."""
+        should_stop = self.fail_fast_condition(test_cases)
+        if self.on_event is None:
+            return should_stop
+
+        def on_result(index: int, result: CodeExecutionResult) -> bool:
+            if index == 0:
+                self.emit("execution", {"iteration": iteration, "result": result.dict()})
+            else:
+                test_case_result = self.build_test_case_result(test_cases[index - 1], result)
+                self.emit("test_result", {"iteration": iteration, "index": index - 1, "result": test_case_result.dict()})
+            return should_stop(index, result) if should_stop is not None else False
+
+        return on_result
+
+    def build_test_case_result(self, test_case: TestCase, execution_result: Optional[CodeExecutionResult]) -> TestCaseResult:
+        if execution_result is None:
+            # Not run because the fail-fast policy stopped this iteration early
+            return TestCaseResult(
+                input=test_case.input,
+                expected_output=test_case.expected_output,
+                actual_output=None,
+                passed=False,
+                stderror=None,
+                compiler_errors=None,
+                time='0',
+                memory=0,
+                skipped=True
+            )
+
+        return TestCaseResult(
+            input=test_case.input,
+            expected_output=test_case.expected_output,
+            actual_output=execution_result.output,
+            passed=self.output_matches(execution_result.output, test_case.expected_output),
+            stderror=execution_result.stderror,
+            compiler_errors=execution_result.compiler_errors,
+            time=execution_result.time,
+            memory=execution_result.memory
+        )
+
     def parse_llm_response(self, response_text):
         """Parses LLM response to extract chain of thought and formatted code."""
-        # Extract Chain of Thought
-        thought_start = response_text.find("CHAIN_OF_THOUGHT:")
-        code_start = response_text.find("CODE:")
+        return parse_response(response_text)
 
-        if thought_start == -1 or code_start == -1:
-            raise ValueError("Response format invalid: Missing CHAIN_OF_THOUGHT or CODE section.")
+    def candidate_messages(
+        self,
+        model: str,
+        language: str,
+        question: str,
+        prompt_test_cases: List[Dict[str, Any]],
+        explanation: str,
+        base: Optional[Candidate]
+    ) -> List[Dict[str, str]]:
+        """The messages asking for new code, or for a fix of the base candidate."""
+        if base is None:
+            return self.generator.initial_messages(language, question, prompt_test_cases, explanation)
+        if self.refinement_mode == "conversation":
+            return self.generator.conversation_messages(model, base.completion.conversation, base.test_case_results)
+        return self.generator.refine_messages(model, language, question, base.code, base.test_case_results)
+
+    def start_generation(
+        self,
+        index: int,
+        iteration: int,
+        model: str,
+        language: str,
+        question: str,
+        prompt_test_cases: List[Dict[str, Any]],
+        explanation: str,
+        base: Optional[Candidate]
+    ) -> Generation:
+        """
+        Start generating a candidate in the background. With EARLY_EXECUTION the response is streamed
+        through a StreamingResponseParser so its code is available before the response has finished.
+        Candidate 0 uses the regular sampling settings; the others are sampled at CANDIDATE_TEMPERATURE
+        so they explore different solutions.
+        """
+        suffix = f":{index}" if self.candidates > 1 else ""
+        token_callback = self.token_callback(iteration) if index == 0 else None
+        parser = StreamingResponseParser()
+        code = asyncio.get_running_loop().create_future()
 
-        # Extract and clean Chain of Thought
-        chain_of_thought_lines = response_text[thought_start + len("CHAIN_OF_THOUGHT:"):code_start].strip().split("\n")
-        chain_of_thought = [line.lstrip("- ").strip() for line in chain_of_thought_lines if line.strip()]
+        def on_token(delta: str) -> None:
+            if token_callback is not None:
+                token_callback(delta)
+            # The parser keeps every delta so a partial completion can be built from its text
+            if parser.feed(delta) and not code.done():
+                code.set_result(parser.result)
 
-        # Extract Code using regex (captures everything inside triple backticks)
-        code_match = re.search(r"```(?:\w+)?\n(.*?)```", response_text, re.DOTALL)
-        if not code_match:
-            raise ValueError("Response format invalid: No properly formatted code block found.")
+        messages = self.candidate_messages(model, language, question, prompt_test_cases, explanation, base)
+        temperature = None if index == 0 else CANDIDATE_TEMPERATURE
+        started = time.perf_counter()
+        completion = asyncio.ensure_future(self.stages.timed(
+            f"generate:{iteration}{suffix}",
+            self.generator.complete(messages, model, on_token if EARLY_EXECUTION else token_callback, temperature)
+        ))
+        return Generation(completion, code, parser, messages, started)
 
-        corrected_code = code_match.group(1).strip()
+    async def wait_for_code(self, generation: Generation) -> Any:
+        """Return (chain_of_thought, code) from the streamed code block if it completes first, else from the full response."""
+        await asyncio.wait({generation.completion, generation.code}, return_when=asyncio.FIRST_COMPLETED)
+        if generation.code.done():
+            return generation.code.result()
+        return self.parse_llm_response(generation.completion.result().content)
+
+    async def finish_generation(self, generation: Generation, needed: bool) -> Completion:
+        """
+        Return the full completion of a generation whose code has been run. The rest of a response that is
+        not needed is cancelled rather than awaited, and a response that fails after its code streamed in
+        keeps the text streamed so far; either way the completion is built from the parser's text.
+        """
+        if not needed and not generation.completion.done():
+            generation.completion.cancel()
+            await asyncio.gather(generation.completion, return_exceptions=True)
+            return generation.partial()
+        try:
+            return await generation.completion
+        except Exception as e:
+            if not generation.code.done():
+                raise
+            logger.warning(f"Response failed after its code streamed in, keeping the streamed text: {e}")
+            return generation.partial()
+
+    def draft_candidates(self, model: str, language: str, question: str, prompt_test_cases: List[Dict[str, Any]], explanation: str) -> List[Generation]:
+        """Start the first iteration's generation for every candidate."""
+        return [
+            self.start_generation(index, 1, model, language, question, prompt_test_cases, explanation, None)
+            for index in range(self.candidates)
+        ]
+
+    async def wait_for_drafts(self, drafts: List[Generation]) -> List[Generation]:
+        """Wait until each draft's code is available (or it failed)."""
+        await asyncio.gather(*(self.wait_for_code(draft) for draft in drafts), return_exceptions=True)
+        return drafts
+
+    async def cancel_drafts(self, drafts: List[Generation]) -> None:
+        """Cancel the responses of drafts that no candidate used, e.g. when a stage failed or the request was cancelled."""
+        unused = [draft.completion for draft in drafts if not draft.completion.done()]
+        for completion in unused:
+            completion.cancel()
+        await asyncio.gather(*unused, return_exceptions=True)
+
+    async def run_candidate(
+        self,
+        index: int,
+        iteration: int,
+        model: str,
+        language: str,
+        question: str,
+        test_cases: List[TestCase],
+        explanation: str,
+        user_input: str,
+        base: Optional[Candidate],
+        draft: Optional[Generation] = None
+    ) -> Candidate:
+        """
+        Run one candidate against every test case, generating it unless it was drafted already.
+        Execution starts as soon as the code is available; the rest of the response keeps streaming
+        meanwhile and is awaited before returning, unless the candidate passed and no conversation
+        turn will build on it.
+        """
+        primary = index == 0
+        suffix = f":{index}" if self.candidates > 1 else ""
+        generation = draft
+        if generation is None:
+            prompt_test_cases = [test_case.dict() for test_case in test_cases]
+            generation = self.start_generation(index, iteration, model, language, question, prompt_test_cases, explanation, base)
 
-        return chain_of_thought, corrected_code
+        try:
+            cot, code = await self.stages.timed(f"code:{iteration}{suffix}", self.wait_for_code(generation))
+            if primary:
+                self.emit("chain_of_thought", {"iteration": iteration, "chain_of_thought": cot, "code": code})
+
+            # Execute the code with user input (if provided) and every test case together
+            execution_results = await self.stages.timed(f"execute:{iteration}{suffix}", execute_many(
+                code,
+                language,
+                [user_input] + [test_case.input for test_case in test_cases],
+                mode=self.execution_mode,
+                semaphore=self.execution_semaphore,
+                stop_when=self.execution_callback(iteration, test_cases) if primary else self.fail_fast_condition(test_cases)
+            ))
+            test_case_results = [
+                self.build_test_case_result(test_case, test_case_result)
+                for test_case, test_case_result in zip(test_cases, execution_results[1:])
+            ]
+            passed = all(test_case.passed for test_case in test_case_results)
+            completion = await self.finish_generation(generation, needed=not passed or self.refinement_mode == "conversation")
+        finally:
+            generation.completion.cancel()
+
+        return Candidate(
+            index=index,
+            cot=cot,
+            code=code,
+            execution_result=execution_results[0] or empty_result(),
+            test_case_results=test_case_results,
+            completion=completion
+        )
+
+    async def best_candidate(
+        self,
+        iteration: int,
+        model: str,
+        language: str,
+        question: str,
+        test_cases: List[TestCase],
+        explanation: str,
+        user_input: str,
+        base: Optional[Candidate],
+        drafts: Optional[List[Generation]] = None
+    ) -> Candidate:
+        """
+        Run self.candidates candidates concurrently and return the first one that passes every test case,
+        cancelling the others, or else the one passing the most (lowest index on ties).
+        """
+        def run(index: int):
+            draft = drafts[index] if drafts is not None else None
+            return self.run_candidate(index, iteration, model, language, question, test_cases, explanation, user_input, base, draft)
+
+        if self.candidates == 1:
+            return await run(0)
+
+        tasks = [asyncio.ensure_future(run(index)) for index in range(self.candidates)]
+        best: Optional[Candidate] = None
+        error: Optional[Exception] = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    candidate = await next_done
+                except Exception as e:
+                    logger.error(f"Candidate failed in iteration {iteration}: {e}")
+                    error = e
+                    continue
+
+                self.emit("candidate", {
+                    "iteration": iteration,
+                    "index": candidate.index,
+                    "passed": candidate.passed,
+                    "total": len(candidate.test_case_results)
+                })
+                if candidate.success:
+                    return candidate
+                if best is None or (candidate.passed, -candidate.index) > (best.passed, -best.index):
+                    best = candidate
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if best is None:
+            raise error
+        return best
+
+    def test_case_model(self, model: str) -> str:
+        """The model that generates test cases: the first cascade step."""
+        return self.cascade_models(model)[0]
+
+    async def generate_test_cases(self, model: str, language: str, question: str, explanation: str, user_input: str) -> List[TestCase]:
+        test_cases_dict = await self.generator.generate_test_cases(self.test_case_model(model), language, question, explanation, user_input)
+        return [TestCase(**test_case) for test_case in test_cases_dict]
+
+    async def reuse_solution(self, solution: Dict[str, Any], language: str, test_cases: List[TestCase], user_input: str = "", verify: bool = True) -> Optional[PipelineResult]:
+        """
+        Build the result from a previously passing solution, or return None if it no longer holds up. The
+        solution is always run on user_input and must complete normally; with verify it is also run against
+        the current test cases in the same batch, stopping at the first failure, and must pass all of them.
+        """
+        code = solution["generated_code"]
+        cot = solution["chain_of_thought"]
+        checked = test_cases if verify else []
+
+        def first_failure(index: int, result: CodeExecutionResult) -> bool:
+            if index == 0:
+                return not is_cacheable(result)
+            return not self.output_matches(result.output, checked[index - 1].expected_output)
+
+        execution_results = await self.stages.timed("verify", execute_many(
+            code,
+            language,
+            [user_input] + [test_case.input for test_case in checked],
+            mode=self.execution_mode,
+            semaphore=self.execution_semaphore,
+            stop_when=first_failure
+        ))
+        execution_result = execution_results[0] or empty_result()
+        test_case_results = [
+            self.build_test_case_result(test_case, test_case_result)
+            for test_case, test_case_result in zip(checked, execution_results[1:])
+        ]
+        # is_cacheable holds only for a run that compiled and exited cleanly within its limits
+        if not is_cacheable(execution_result) or not all(test_case.passed for test_case in test_case_results):
+            logger.info(f"Stored solution {solution['id']} failed verification, generating a new one")
+            return None
+
+        self.emit("solution_reused", {"iteration_id": str(solution["id"]), "verified": verify, "code": code})
+        history = []
+        history.append(CodeIterationHistory(
+            iteration=1,
+            chain_of_thought=cot,
+            code=code,
+            execution_result=execution_result,
+            test_results=test_case_results,
+            model=solution["model"],
+            success=bool(test_case_results)
+        ))
+        return PipelineResult(
+            cot=cot,
+            final_code=code,
+            final_result=execution_result,
+            test_results=test_case_results,
+            iterations=1,
+            history=history,
+            success=True,
+            reused=True,
+            stage_timings=self.stages.timings
+        )
 
     async def run_pipeline(
         self,
@@ -75,107 +495,102 @@ class CodeGenerationPipeline:
     ) -> PipelineResult:
         """Run the complete code generation and refinement pipeline."""
         iteration = 0
-        current_code = None
         history = []
+        best = None
+        cot, code = [], ""
+        execution_result = empty_result()
+        test_case_results = []
         
-        # Generate test cases if none are provided
-        if not test_cases:
-            test_cases_dict = self.generator.generate_test_cases(model, language, question, explanation, user_input)
-            test_cases = [TestCase(**test_case) for test_case in test_cases_dict]
-        
-        while iteration < self.max_iterations:
-            try:
-                # Generate or refine code
-                if current_code is None:
-                    # Serialize test cases to dictionaries
-                    test_cases_dict = [test_case.dict() for test_case in test_cases]
-                    current_code = self.generator.generate_initial_code(model, language, question, test_cases_dict, explanation)
-                else:
-                    # Serialize test cases to dictionaries before passing to refine_code
-                    test_cases_dict = [test_case.dict() for test_case in test_cases]
+        generated_test_cases = None
+
+        # Draft the first code while test cases are generated (if none are provided);
+        # without test cases the draft works from the explanation and the example input
+        if test_cases:
+            prompt_test_cases = [test_case.dict() for test_case in test_cases]
+        else:
+            prompt_test_cases = [{"input": user_input, "expected_output": None}]
+            self.stages.add("test_cases", lambda results: self.generate_test_cases(model, language, question, explanation, user_input))
+        drafts = self.draft_candidates(self.model_for_iteration(1, model), language, question, prompt_test_cases, explanation)
+        self.stages.add("draft", lambda results: self.wait_for_drafts(drafts))
+        try:
+            results = await self.stages.run()
+
+            if not test_cases:
+                test_cases = generated_test_cases = results["test_cases"]
+            self.emit("test_cases", {"test_cases": [test_case.dict() for test_case in test_cases]})
 
+            while iteration < self.max_iterations:
                 try:
-                    cot, code = self.parse_llm_response(current_code)
+                    # Generate code, or refine the best candidate of the previous iteration
+                    iteration_model = self.model_for_iteration(iteration + 1, model)
+                    best = await self.best_candidate(iteration + 1, iteration_model, language, question, test_cases, explanation, user_input, best, drafts if iteration == 0 else None)
+                    cot, code = best.cot, best.code
+                    execution_result = best.execution_result
+                    test_case_results = best.test_case_results
                     print("Extracted Chain of Thought:", cot)
                     print("Extracted Code:\n", code)
-                except json.JSONDecodeError as e:
-                    print("JSON parsing error:", e)
-                except Exception as e:
-                    print("Unexpected error:", e)
 
-                # Execute the code with user input (if provided)
-                print('the code before execution is:', code)
-                execution_result = await execute_code(code, language, user_input)
+                    self.emit("iteration", {
+                        "iteration": iteration + 1,
+                        "candidate": best.index,
+                        "model": iteration_model,
+                        "passed": best.passed,
+                        "total": len(test_case_results),
+                        "success": best.success,
+                        "input_tokens": best.completion.input_tokens,
+                        "llm_latency": best.completion.latency
+                    })
                 
-                # Validate test cases
-                test_case_results = []
-                for test_case in test_cases:
-                    test_case_result = await execute_code(code, language, test_case.input)
-                    
-                    # Enhanced comparison logic
-                    actual = test_case_result.output.strip()
-                    expected = test_case.expected_output.strip() if test_case.expected_output else ""
-                    
-                    passed = (
-                        actual == expected or 
-                        actual.lower() == expected.lower() or
-                        self.normalize_array_string(actual) == self.normalize_array_string(expected) or
-                        self.normalize_array_string(actual.lower()) == self.normalize_array_string(expected.lower())
-                    ) if expected else False
-                    
-                    test_case_results.append(TestCaseResult(
-                        input=test_case.input,
-                        expected_output=test_case.expected_output,
-                        actual_output=test_case_result.output,
-                        passed=passed,
-                        stderror=test_case_result.stderror,
-                        compiler_errors=test_case_result.compiler_errors,
-                        time=test_case_result.time,
-                        memory=test_case_result.memory
-                    ))
+                    # Pass test case results to the LLM for validation
+                    # test_results = self.generator.validate_test_cases(model, json.dumps([result.dict() for result in test_case_results]))
                 
-                # Pass test case results to the LLM for validation
-                # test_results = self.generator.validate_test_cases(model, json.dumps([result.dict() for result in test_case_results]))
+                    # Store iteration history
+                    history.append(CodeIterationHistory(
+                        iteration=iteration + 1,
+                        chain_of_thought=cot,
+                        code=code,
+                        execution_result=execution_result,
+                        test_results=test_case_results,
+                        candidate=best.index,
+                        model=iteration_model,
+                        input_tokens=best.completion.input_tokens,
+                        llm_latency=best.completion.latency,
+                        success=best.success and bool(test_case_results)
+                    ))
                 
-                # Store iteration history
-                history.append(CodeIterationHistory(
-                    iteration=iteration + 1,
-                    chain_of_thought=cot,
-                    code=code,
-                    execution_result=execution_result,
-                    test_results=test_case_results   
-                ))
+                    # Check if all test cases passed
+                    if best.success:
+                        logger.info("All test cases passed. Stopping pipeline.")
+                        break
                 
-                # Check if all test cases passed
-                if all(test_case.passed for test_case in test_case_results):
-                    logger.info("All test cases passed. Stopping pipeline.")
+                    iteration += 1
+            
+                except httpx.HTTPStatusError as e:
+                    logger.error(f"HTTP error occurred: {e}")
+                    history.append(CodeIterationHistory(
+                        iteration=iteration + 1,
+                        chain_of_thought=cot,
+                        code=code,
+                        execution_result=CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors=''),
+                        test_results=[],
+                        model=iteration_model
+                    ))
                     break
-                
-                iteration += 1
+                except Exception as e:
+                    logger.error(f"Execution error occurred: {e}")
+                    history.append(CodeIterationHistory(
+                        iteration=iteration + 1,
+                        chain_of_thought=cot,
+                        code=code,
+                        execution_result=CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors=''),
+                        test_results=[],
+                        model=iteration_model
+                    ))
+                    break
+        finally:
+            # Drafts no candidate ran (a failed stage, max_iterations=0, a client disconnect) are still streaming
+            await self.cancel_drafts(drafts)
 
-                current_code = self.generator.refine_code(model, language, question, code, test_cases_dict, test_case_results)
-            
-            except httpx.HTTPStatusError as e:
-                logger.error(f"HTTP error occurred: {e}")
-                history.append(CodeIterationHistory(
-                    iteration=iteration + 1,
-                    chain_of_thought=cot,
-                    code=code,
-                    execution_result=CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors=''),
-                    test_results=[]
-                ))
-                break
-            except Exception as e:
-                logger.error(f"Execution error occurred: {e}")
-                history.append(CodeIterationHistory(
-                    iteration=iteration + 1,
-                    chain_of_thought=cot,
-                    code=code,
-                    execution_result=CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors=''),
-                    test_results=[]
-                ))
-                break
-        
         return PipelineResult(
             cot=cot,
             final_code=code,
@@ -183,5 +598,7 @@ class CodeGenerationPipeline:
             test_results=test_case_results,
             iterations=iteration + 1,
             history=history,
-            success=all(test_case.passed for test_case in test_case_results)
+            success=best is not None and best.success,
+            generated_test_cases=generated_test_cases,
+            stage_timings=self.stages.timings
         )
\ No newline at end of file
@@ -0,0 +1,136 @@
+import difflib
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from models import TestCaseResult
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Token ceiling for a rendered refine prompt; per-model values override the default
+REFINE_PROMPT_MAX_TOKENS = int(os.getenv("REFINE_PROMPT_MAX_TOKENS", "6000"))
+MODEL_PROMPT_TOKEN_LIMITS: Dict[str, int] = {
+    # 8k context windows, leaving room for the completion
+    "llama3-70b-8192": 4000,
+    "gemma2-9b-it": 4000,
+    **json.loads(os.getenv("MODEL_PROMPT_TOKEN_LIMITS", "{}")),
+}
+
+# Successively tighter rendering settings tried until the prompt fits:
+# (characters kept per output or error, failing cases shown, include passing cases)
+BUDGET_LEVELS: List[Tuple[int, Optional[int], bool]] = [
+    (2000, None, True),
+    (1000, None, False),
+    (500, 10, False),
+    (200, 5, False),
+    (100, 3, False),
+]
+
+# Fallback when tiktoken is unavailable. Prose averages about four characters per token but
+# code and test data tokenize more densely, so the estimate errs towards more tokens.
+CHARS_PER_TOKEN = 3
+
+_encoding = None
+_encoding_failed = False
+
+def load_encoding():
+    """
+    Load tiktoken's encoding, which downloads its BPE file on first use unless TIKTOKEN_CACHE_DIR has it.
+    Called at startup so the download does not block a request; returns None if it cannot be loaded.
+    """
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            _encoding_failed = True
+            logger.warning(f"Could not load the tiktoken encoding, estimating token counts instead: {e}")
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken when its encoding is available, otherwise estimate from the text length."""
+    encoding = load_encoding()
+    if encoding is not None:
+        try:
+            return len(encoding.encode(text, disallowed_special=()))
+        except Exception as e:
+            logger.warning(f"Token counting failed, estimating instead: {e}")
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def token_limit(model: str) -> int:
+    return MODEL_PROMPT_TOKEN_LIMITS.get(model, REFINE_PROMPT_MAX_TOKENS)
+
+def truncate(text: Optional[str], max_chars: int) -> str:
+    """Keep the head and tail of long text, noting how much was cut from the middle."""
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return text
+    half = max_chars // 2
+    return f"{text[:half]}\n... [{len(text) - 2 * half} characters omitted] ...\n{text[-half:]}"
+
+def describe_output(expected: Optional[str], actual: Optional[str], max_chars: int) -> str:
+    """Show expected and actual output, as a line diff when either spans several lines."""
+    expected = (expected or "").strip()
+    actual = (actual or "").strip()
+    if "\n" in expected or "\n" in actual:
+        diff = difflib.unified_diff(expected.splitlines(), actual.splitlines(), "expected", "actual", n=1, lineterm="")
+        return "  Output diff:\n" + truncate("\n".join(diff), max_chars)
+    return f"  Expected output: {truncate(expected, max_chars)}\n  Actual output: {truncate(actual, max_chars)}"
+
+def render_failures(results: List[TestCaseResult], max_chars: int, max_cases: Optional[int]) -> str:
+    """Render failing test cases, listing each distinct error once and referring to it by number."""
+    failing = [(number, result) for number, result in enumerate(results, start=1) if not result.passed and not result.skipped]
+    skipped = sum(result.skipped for result in results)
+    shown = failing if max_cases is None else failing[:max_cases]
+
+    errors: Dict[str, List[int]] = {}
+    blocks = []
+    for number, result in shown:
+        block = f"Test case {number}:\n  Input: {truncate(result.input, max_chars)}\n"
+        block += describe_output(result.expected_output, result.actual_output, max_chars)
+        error = "\n".join(part.strip() for part in (result.compiler_errors, result.stderror) if part and part.strip())
+        if error:
+            cases = errors.setdefault(error, [])
+            cases.append(number)
+            block += f"\n  Error: E{list(errors).index(error) + 1}"
+        blocks.append(block)
+
+    if len(shown) < len(failing):
+        blocks.append(f"... {len(failing) - len(shown)} more failing test cases omitted.")
+    if skipped:
+        blocks.append(f"{skipped} test cases were not run after the failures above.")
+    for position, (error, cases) in enumerate(errors.items(), start=1):
+        blocks.append(f"E{position} (test cases {', '.join(map(str, cases))}):\n{truncate(error, max_chars)}")
+    return "\n\n".join(blocks) if blocks else "No failing test cases."
+
+def render_passing(results: List[TestCaseResult], max_chars: int) -> str:
+    passing = [(number, result) for number, result in enumerate(results, start=1) if result.passed]
+    if not passing:
+        return "None."
+    return "\n".join(
+        f"Test case {number}: input {truncate(result.input, max_chars)!r} -> {truncate(result.expected_output, max_chars)!r}"
+        for number, result in passing
+    )
+
+def build_refine_prompt(model: str, results: List[TestCaseResult], render: Callable[[str, str], str]) -> str:
+    """
+    Render the refine prompt within the model's token ceiling.
+    render receives the failing-case and passing-case sections; they are shrunk level by level
+    (shorter outputs, fewer cases, passing cases dropped) until the whole prompt fits.
+    """
+    limit = token_limit(model)
+    prompt = ""
+    for max_chars, max_cases, include_passing in BUDGET_LEVELS:
+        passing = render_passing(results, max_chars) if include_passing else "Omitted to save space."
+        prompt = render(render_failures(results, max_chars, max_cases), passing)
+        tokens = count_tokens(prompt)
+        if tokens <= limit:
+            return prompt
+    logger.warning(f"Refine prompt for {model} is {tokens} tokens, above its {limit} token ceiling")
+    return prompt
@@ -70,13 +70,12 @@ REFINE_PROMPT = PromptTemplate(
 
         "2. **Review the original code that needs fixing:**\n{code}\n\n"
 
-        "3. **Study the test case results:**\n"
-        "   Test Case Results:\n{test_case_results}\n\n"
+        "3. **Study the failing test cases:**\n{test_case_results}\n\n"
         "   Pay special attention to the actual outputs and compare them with the expected outputs.\n"
-        "   Identify the specific test cases that failed and the reasons for the failures.\n\n"
+        "   Identify the reasons for the failures; errors shared by several test cases are listed once.\n\n"
         "   **Note:** If the actual output is correct but fails due to formatting, consider updating the expected output.\n\n"
 
-        "4. **Review the test cases that need to pass:**\n{test_cases}\n\n"
+        "4. **Test cases that already pass and must keep passing:**\n{test_cases}\n\n"
 
         "5. **Debug and refine the approach:**\n"
         "   - Identify the root causes of failures or errors.\n"
@@ -125,6 +124,21 @@ REFINE_PROMPT = PromptTemplate(
     )
 )
 
+# Follow-up turn for conversation refinement; the problem and the previous answer are already in the conversation
+CONVERSATION_REFINE_PROMPT = PromptTemplate(
+    input_variables=["test_cases", "test_case_results"],
+    template=(
+        "Your previous solution did not pass all test cases.\n\n"
+
+        "**Failing test cases:**\n{test_case_results}\n\n"
+
+        "**Test cases that already pass and must keep passing:**\n{test_cases}\n\n"
+
+        "Identify the root cause of each failure, fix the code, and answer again in exactly the same "
+        "CHAIN_OF_THOUGHT / CODE format as before with the full corrected solution."
+    )
+)
+
 # Prompt for test case validation
 VALIDATE_TEST_CASES_PROMPT = PromptTemplate(
     input_variables=["test_cases"],
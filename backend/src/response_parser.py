@@ -0,0 +1,50 @@
+import re
+from typing import List, Optional, Tuple
+
+THOUGHT_MARKER = "CHAIN_OF_THOUGHT:"
+CODE_MARKER = "CODE:"
+CODE_BLOCK = re.compile(r"```(?:\w+)?\n(.*?)```", re.DOTALL)
+
+def parse_response(response_text: str) -> Tuple[List[str], str]:
+    """Extract the chain of thought and the code from a response in the CHAIN_OF_THOUGHT / CODE format."""
+    thought_start = response_text.find(THOUGHT_MARKER)
+    code_start = response_text.find(CODE_MARKER)
+
+    if thought_start == -1 or code_start == -1:
+        raise ValueError("Response format invalid: Missing CHAIN_OF_THOUGHT or CODE section.")
+
+    # Extract and clean Chain of Thought
+    chain_of_thought_lines = response_text[thought_start + len(THOUGHT_MARKER):code_start].strip().split("\n")
+    chain_of_thought = [line.lstrip("- ").strip() for line in chain_of_thought_lines if line.strip()]
+
+    # The code is the first fenced block after the CODE marker
+    code_match = CODE_BLOCK.search(response_text, code_start)
+    if not code_match:
+        raise ValueError("Response format invalid: No properly formatted code block found.")
+
+    return chain_of_thought, code_match.group(1).strip()
+
+class StreamingResponseParser:
+    """
+    Accumulates streamed response text and reports the chain of thought and code as soon as the
+    code block's closing fence has arrived, without waiting for the rest of the response.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        self.result: Optional[Tuple[List[str], str]] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def feed(self, delta: str) -> Optional[Tuple[List[str], str]]:
+        """Add a delta; returns (chain_of_thought, code) once the code block is complete, else None."""
+        self.parts.append(delta)
+        # Only a delta with a backtick can complete the closing fence
+        if self.result is None and "`" in delta:
+            try:
+                self.result = parse_response(self.text)
+            except ValueError:
+                pass
+        return self.result
@@ -0,0 +1,517 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from backends import ExecutionBackend
+from models import CodeExecutionResult
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Number of sandboxed processes allowed to run at the same time on this node
+SANDBOX_WORKERS = int(os.getenv('SANDBOX_WORKERS', str(os.cpu_count() or 2)))
+SANDBOX_CPU_TIME_LIMIT = int(os.getenv('SANDBOX_CPU_TIME_LIMIT', '5'))
+SANDBOX_WALL_TIME_LIMIT = float(os.getenv('SANDBOX_WALL_TIME_LIMIT', '10'))
+SANDBOX_MEMORY_LIMIT_MB = int(os.getenv('SANDBOX_MEMORY_LIMIT_MB', '256'))
+SANDBOX_COMPILE_TIME_LIMIT = float(os.getenv('SANDBOX_COMPILE_TIME_LIMIT', '30'))
+SANDBOX_COMPILE_MEMORY_LIMIT_MB = int(os.getenv('SANDBOX_COMPILE_MEMORY_LIMIT_MB', '1024'))
+SANDBOX_OUTPUT_LIMIT = int(os.getenv('SANDBOX_OUTPUT_LIMIT', str(1024 * 1024)))
+SANDBOX_TMP_DIR = os.getenv('SANDBOX_TMP_DIR') or None
+# Number of built programs kept on disk, keyed by source hash
+SANDBOX_ARTIFACT_CACHE_SIZE = int(os.getenv('SANDBOX_ARTIFACT_CACHE_SIZE', '64'))
+SANDBOX_COMPILE_FILE_SIZE_LIMIT_MB = int(os.getenv('SANDBOX_COMPILE_FILE_SIZE_LIMIT_MB', '256'))
+SANDBOX_GO_CACHE = os.getenv('SANDBOX_GO_CACHE', os.path.join(tempfile.gettempdir(), 'codecraft-go-cache'))
+# Cap on processes and threads per sandbox uid, shared by everything running under that uid
+SANDBOX_MAX_PROCESSES = int(os.getenv('SANDBOX_MAX_PROCESSES', '256'))
+SANDBOX_COMPILE_MAX_PROCESSES = int(os.getenv('SANDBOX_COMPILE_MAX_PROCESSES', '512'))
+
+# Programs run under a dedicated unprivileged uid so they cannot signal or inspect the server
+# (e.g. read /proc/<pid>/environ), nor write to the shared artifacts. Compilers use a second uid
+# so programs cannot tamper with the compile caches either. Switching uids requires running
+# the server as root (or with CAP_SETUID/CAP_SETGID); without SANDBOX_UID the backend is unavailable.
+SANDBOX_UID = int(os.environ['SANDBOX_UID']) if os.getenv('SANDBOX_UID') else None
+SANDBOX_GID = int(os.getenv('SANDBOX_GID') or SANDBOX_UID or 0)
+SANDBOX_BUILD_UID = int(os.getenv('SANDBOX_BUILD_UID') or (SANDBOX_UID or 0) + 1)
+SANDBOX_BUILD_GID = int(os.getenv('SANDBOX_BUILD_GID') or SANDBOX_BUILD_UID)
+
+# Resource limits are applied by util-linux prlimit, which sets them and then execs the
+# program, so they are in place before any user code runs and without relying on preexec_fn
+# (unsafe in a threaded process).
+PRLIMIT = shutil.which("prlimit") or "/usr/bin/prlimit"
+
+# Programs run in new network, mount and pid namespaces: only loopback networking, no view of other
+# processes, and private tmpfs mounts over the world-writable directories and the sandbox's temp
+# directories, with just the run's scratch directory and (read-only) artifact bound back in.
+UNSHARE = shutil.which("unshare") or "/usr/bin/unshare"
+SETPRIV = shutil.which("setpriv") or "/usr/bin/setpriv"
+SHARED_WRITABLE_DIRS = ("/tmp", "/var/tmp", "/dev/shm")
+# Runs as root inside the namespaces: sh -c NAMESPACE_SETUP sandbox WORKDIR ARTIFACT SIZE DIR... -- COMMAND...
+# The scratch directory and artifact are opened before they are covered, and bound back from those
+# descriptors (mount -c keeps /proc/self/fd/N from being resolved to the covered path). The shell
+# stays on as pid 1, since the kernel would shield a program in that place from SIGXCPU, and reports
+# a command killed by signal N as exit status 128 + N.
+NAMESPACE_SETUP = """
+set -e
+workdir=$1 artifact=$2 size=$3
+shift 3
+exec 3<"$workdir" 4<"$artifact"
+while [ "$1" != "--" ]; do
+    mkdir -p "$1"
+    mount -t tmpfs -o "size=$size,mode=1777,nosuid,nodev" tmpfs "$1"
+    shift
+done
+shift
+mkdir -p "$workdir" "$artifact"
+mount -c --bind -o nosuid,nodev /proc/self/fd/3 "$workdir"
+mount -c --bind -o ro,nosuid,nodev /proc/self/fd/4 "$artifact"
+exec 3<&- 4<&-
+cd "$workdir"
+# The command runs as a background job so the shell's note on a killed job goes to its own,
+# dropped stderr rather than the program's
+exec 5<&0 6>&2 2>/dev/null
+"$@" <&5 2>&6 5<&- 6>&- &
+wait $! && exit 0 || exit $?
+"""
+
+# Toolchain locations forwarded to compilers, which otherwise only see a minimal environment
+TOOLCHAIN_ENV_VARS = ("RUSTUP_HOME", "CARGO_HOME", "RUSTUP_TOOLCHAIN", "GOROOT", "JAVA_HOME")
+
+def isolation_error() -> Optional[str]:
+    """Why sandboxed programs cannot be isolated from the server, or None when they can."""
+    if SANDBOX_UID is None:
+        return "SANDBOX_UID is not set"
+    if os.getuid() in (SANDBOX_UID, SANDBOX_BUILD_UID) or SANDBOX_UID == SANDBOX_BUILD_UID:
+        return "SANDBOX_UID and SANDBOX_BUILD_UID must differ from each other and from the server's uid"
+    if os.geteuid() != 0:
+        return "switching to the sandbox uids requires running the server as root"
+    try:
+        probe = subprocess.run([UNSHARE, "--net", "--mount", "--pid", "--fork", "--mount-proc", SETPRIV, "--help"], capture_output=True, timeout=10)
+    except (OSError, subprocess.SubprocessError) as e:
+        return f"unshare or setpriv is unavailable: {e}"
+    if probe.returncode != 0:
+        return f"creating network, mount and pid namespaces failed (containers need CAP_SYS_ADMIN): {probe.stderr.decode(errors='replace').strip()}"
+    return None
+
+@dataclass(frozen=True)
+class LanguageSpec:
+    source_file: str
+    # "{artifact}" is replaced with the directory holding the compiled (or copied) program
+    run_command: List[str]
+    compile_command: Optional[List[str]] = None
+    # Runtimes that reserve far more address space than they use are limited through their own heap flags
+    limit_address_space: bool = True
+    compile_env: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def toolchain(self) -> str:
+        return (self.compile_command or self.run_command)[0]
+
+LANGUAGES = {
+    "python": LanguageSpec(
+        source_file="main.py",
+        run_command=["python3", "{artifact}/main.py"],
+    ),
+    "javascript": LanguageSpec(
+        source_file="main.js",
+        run_command=["node", f"--max-old-space-size={SANDBOX_MEMORY_LIMIT_MB}", "{artifact}/main.js"],
+        limit_address_space=False,
+    ),
+    "c": LanguageSpec(
+        source_file="main.c",
+        compile_command=["gcc", "-O2", "-std=c17", "-o", "main", "main.c", "-lm"],
+        run_command=["{artifact}/main"],
+    ),
+    "cpp": LanguageSpec(
+        source_file="main.cpp",
+        compile_command=["g++", "-O2", "-std=c++17", "-o", "main", "main.cpp"],
+        run_command=["{artifact}/main"],
+    ),
+    "java": LanguageSpec(
+        source_file="Main.java",
+        compile_command=["javac", "Main.java"],
+        run_command=["java", f"-Xmx{SANDBOX_MEMORY_LIMIT_MB}m", "-cp", "{artifact}", "Main"],
+        limit_address_space=False,
+    ),
+    "rust": LanguageSpec(
+        source_file="main.rs",
+        compile_command=["rustc", "-O", "-o", "main", "main.rs"],
+        run_command=["{artifact}/main"],
+    ),
+    "go": LanguageSpec(
+        source_file="main.go",
+        compile_command=["go", "build", "-o", "main", "main.go"],
+        run_command=["{artifact}/main"],
+        limit_address_space=False,
+        # Share the build cache so the standard library is not rebuilt for every program
+        compile_env={"GOCACHE": SANDBOX_GO_CACHE},
+    ),
+    "swift": LanguageSpec(
+        source_file="main.swift",
+        compile_command=["swiftc", "-O", "-o", "main", "main.swift"],
+        run_command=["{artifact}/main"],
+    ),
+    "typescript": LanguageSpec(
+        source_file="main.ts",
+        compile_command=["tsc", "--target", "es2020", "--module", "commonjs", "main.ts"],
+        run_command=["node", f"--max-old-space-size={SANDBOX_MEMORY_LIMIT_MB}", "{artifact}/main.js"],
+        limit_address_space=False,
+    ),
+}
+
+@dataclass
+class Artifact:
+    """A program built once from a source and shared by every run of that source."""
+    directory: Optional[str]
+    compile_error: Optional[CodeExecutionResult] = None
+    in_use: int = 0
+
+@dataclass
+class ProcessResult:
+    stdout: str
+    stderr: str
+    exit_code: int
+    cpu_time: float
+    memory_kb: int
+    timed_out: bool
+
+def build_limits(cpu_seconds: int, memory_mb: int, limit_address_space: bool, file_size: int = SANDBOX_OUTPUT_LIMIT * 4, processes: int = SANDBOX_MAX_PROCESSES) -> List[str]:
+    limits = {
+        "cpu": cpu_seconds,
+        "core": 0,
+        "fsize": file_size,
+        "nproc": processes,
+    }
+    if limit_address_space:
+        limits["as"] = memory_mb * 1024 * 1024
+    return [f"--{name}={value}:{value}" for name, value in limits.items()]
+
+def read_stream(stream, limit: int, chunks: list) -> None:
+    """Read a pipe to EOF, keeping at most limit bytes."""
+    size = 0
+    while True:
+        data = stream.read(65536)
+        if not data:
+            break
+        if size < limit:
+            chunks.append(data[:limit - size])
+        size += len(data)
+    stream.close()
+
+def write_stream(stream, data: bytes) -> None:
+    try:
+        stream.write(data)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except OSError:
+            pass
+
+def kill_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def make_read_only(directory: str) -> None:
+    """Give a directory tree to the server's uid and drop every write bit, keeping it readable and executable by others."""
+    for root, directories, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            os.chown(path, os.getuid(), os.getgid(), follow_symlinks=False)
+            if not os.path.islink(path):
+                os.chmod(path, (os.stat(path).st_mode | 0o444) & ~0o222)
+        for name in directories:
+            os.chown(os.path.join(root, name), os.getuid(), os.getgid(), follow_symlinks=False)
+    for root, directories, _ in os.walk(directory, topdown=False):
+        for name in directories:
+            path = os.path.join(root, name)
+            if not os.path.islink(path):
+                os.chmod(path, 0o555)
+    os.chown(directory, os.getuid(), os.getgid())
+    os.chmod(directory, 0o555)
+
+def namespace_command(command: List[str], uid: int, gid: int, workdir: str, artifact: str, tmpfs_mb: int) -> List[str]:
+    """Wrap a command to run as uid in new namespaces that only see workdir and, read-only, artifact of the sandbox's files."""
+    covered = list(dict.fromkeys([*SHARED_WRITABLE_DIRS, os.path.dirname(workdir), os.path.dirname(artifact)]))
+    return [
+        UNSHARE, "--net", "--mount", "--pid", "--fork", "--mount-proc", "--kill-child", "--",
+        "sh", "-c", NAMESPACE_SETUP, "sandbox", workdir, artifact, f"{tmpfs_mb}m", *covered, "--",
+        SETPRIV, f"--reuid={uid}", f"--regid={gid}", "--clear-groups", "--inh-caps=-all", "--bounding-set=-all", "--no-new-privs", "--",
+        *command,
+    ]
+
+def run_process(command: List[str], cwd: str, stdin: str, limits: List[str], wall_time: float, uid: int, gid: int, extra_env: Optional[Dict[str, str]] = None, on_start: Optional[Callable[[int], None]] = None, artifact: Optional[str] = None) -> ProcessResult:
+    """
+    Run a command as uid inside cwd with rlimits applied and a wall-clock timeout. Blocks the calling thread.
+    With an artifact directory the command is isolated by namespace_command.
+    """
+    env = {
+        "PATH": os.environ.get("PATH", "/usr/bin:/bin"),
+        "HOME": cwd,
+        "TMPDIR": cwd,
+        "LANG": "C.UTF-8",
+        **(extra_env or {}),
+    }
+    command = [PRLIMIT, *limits, "--", *command]
+    if artifact is not None:
+        # unshare has to start as root; setpriv switches to uid inside the namespaces
+        command = namespace_command(command, uid, gid, cwd, artifact, SANDBOX_MEMORY_LIMIT_MB)
+    process = subprocess.Popen(
+        command,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        user=uid if artifact is None else None,
+        group=gid if artifact is None else None,
+        extra_groups=[] if artifact is None else None,
+    )
+    if on_start is not None:
+        on_start(process.pid)
+
+    timed_out = threading.Event()
+
+    def on_timeout():
+        timed_out.set()
+        kill_group(process.pid)
+
+    stdout_chunks: list = []
+    stderr_chunks: list = []
+    threads = [
+        threading.Thread(target=write_stream, args=(process.stdin, stdin.encode())),
+        threading.Thread(target=read_stream, args=(process.stdout, SANDBOX_OUTPUT_LIMIT, stdout_chunks)),
+        threading.Thread(target=read_stream, args=(process.stderr, SANDBOX_OUTPUT_LIMIT, stderr_chunks)),
+    ]
+    timer = threading.Timer(wall_time, on_timeout)
+    timer.start()
+    for thread in threads:
+        thread.start()
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if artifact is not None and process.returncode > 128:
+            process.returncode = 128 - process.returncode
+    finally:
+        timer.cancel()
+        # Take down anything the program left running so the pipes reach EOF
+        kill_group(process.pid)
+        for thread in threads:
+            thread.join()
+
+    return ProcessResult(
+        stdout=b"".join(stdout_chunks).decode(errors="replace"),
+        stderr=b"".join(stderr_chunks).decode(errors="replace"),
+        exit_code=process.returncode,
+        cpu_time=usage.ru_utime + usage.ru_stime,
+        memory_kb=usage.ru_maxrss,
+        timed_out=timed_out.is_set(),
+    )
+
+def describe_failure(result: ProcessResult) -> str:
+    """Map a finished process to the matching Judge0 status description."""
+    if result.timed_out or result.exit_code in (-signal.SIGXCPU, -signal.SIGKILL):
+        return "Time Limit Exceeded"
+    if result.exit_code < 0:
+        signal_name = signal.Signals(-result.exit_code).name
+        if signal_name in ("SIGSEGV", "SIGXFSZ", "SIGFPE", "SIGABRT"):
+            return f"Runtime Error ({signal_name})"
+        return "Runtime Error (Other)"
+    return "Runtime Error (NZEC)"
+
+class LocalSandboxBackend(ExecutionBackend):
+    """
+    Executes code in local subprocesses. Every run gets its own temporary directory, runs under
+    SANDBOX_UID in its own network, mount and pid namespaces with CPU, memory, file size and process
+    count rlimits and a wall-clock timeout, and is scheduled on a fixed-size worker pool.
+
+    Each unique source is compiled once into an artifact that is cached by source hash and shared
+    by every input it runs against, so a batch of N test cases costs one compile and a compile
+    failure is produced once for the whole batch.
+
+    Reported memory is the peak RSS from wait4, which on Linux also counts the address space
+    inherited from this process at spawn time, so it is an upper bound for small programs.
+    """
+
+    name = "local"
+
+    def __init__(self, workers: int = SANDBOX_WORKERS, artifact_cache_size: int = SANDBOX_ARTIFACT_CACHE_SIZE):
+        self.workers = workers
+        self.artifact_cache_size = artifact_cache_size
+        self.pool: Optional[ThreadPoolExecutor] = None
+        self.artifacts: "OrderedDict[str, Artifact]" = OrderedDict()
+        self.builds: Dict[str, asyncio.Task] = {}
+        self.compilations = 0
+        self.artifact_hits = 0
+
+    def get_pool(self) -> ThreadPoolExecutor:
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="sandbox")
+        return self.pool
+
+    async def start(self) -> None:
+        self.get_pool()
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        for artifact in self.artifacts.values():
+            if artifact.directory:
+                shutil.rmtree(artifact.directory, ignore_errors=True)
+        self.artifacts.clear()
+
+    def supports(self, language: str) -> bool:
+        spec = LANGUAGES.get(language.lower())
+        return spec is not None and shutil.which(spec.toolchain) is not None
+
+    def get_spec(self, language: str) -> LanguageSpec:
+        spec = LANGUAGES.get(language.lower())
+        if not spec:
+            raise ValueError(f"Unsupported language: {language}")
+        return spec
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "artifacts": len(self.artifacts),
+            "compilations": self.compilations,
+            "artifact_hits": self.artifact_hits,
+        }
+
+    def build(self, code: str, spec: LanguageSpec) -> Artifact:
+        """Write the source into a fresh directory and compile it there. Blocks the calling thread."""
+        directory = tempfile.mkdtemp(prefix="codecraft-build-", dir=SANDBOX_TMP_DIR)
+        with open(os.path.join(directory, spec.source_file), "w") as source:
+            source.write(code)
+        if spec.compile_command is None:
+            make_read_only(directory)
+            return Artifact(directory=directory)
+        os.chown(directory, SANDBOX_BUILD_UID, SANDBOX_BUILD_GID)
+
+        limits = build_limits(
+            int(SANDBOX_COMPILE_TIME_LIMIT),
+            SANDBOX_COMPILE_MEMORY_LIMIT_MB,
+            spec.limit_address_space,
+            SANDBOX_COMPILE_FILE_SIZE_LIMIT_MB * 1024 * 1024,
+            SANDBOX_COMPILE_MAX_PROCESSES
+        )
+        compile_env = {name: os.environ[name] for name in TOOLCHAIN_ENV_VARS if name in os.environ}
+        compile_env.update(spec.compile_env)
+        for cache_directory in spec.compile_env.values():
+            os.makedirs(cache_directory, mode=0o700, exist_ok=True)
+            os.chown(cache_directory, SANDBOX_BUILD_UID, SANDBOX_BUILD_GID)
+        result = run_process(spec.compile_command, directory, "", limits, SANDBOX_COMPILE_TIME_LIMIT, SANDBOX_BUILD_UID, SANDBOX_BUILD_GID, compile_env)
+        if result.exit_code == 0 and not result.timed_out:
+            # Programs only get to read and execute what was built
+            make_read_only(directory)
+            return Artifact(directory=directory)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        return Artifact(directory=None, compile_error=CodeExecutionResult(
+            output='',
+            stderror='',
+            time='0',
+            memory='0',
+            compiler_errors=(result.stdout + result.stderr) or "Compilation timed out",
+            status="Compilation Error"
+        ))
+
+    async def build_and_store(self, key: str, code: str, spec: LanguageSpec) -> Artifact:
+        try:
+            loop = asyncio.get_running_loop()
+            artifact = await loop.run_in_executor(self.get_pool(), self.build, code, spec)
+            self.compilations += 1
+            self.artifacts[key] = artifact
+            self.evict()
+            return artifact
+        finally:
+            del self.builds[key]
+
+    async def acquire_artifact(self, code: str, spec: LanguageSpec) -> Artifact:
+        """Return the artifact for this source, building it at most once even under concurrent callers."""
+        key = hashlib.sha256(f"{spec.source_file}\0{code}".encode()).hexdigest()
+        artifact = self.artifacts.get(key)
+        if artifact is not None:
+            self.artifact_hits += 1
+            self.artifacts.move_to_end(key)
+        else:
+            if key not in self.builds:
+                self.builds[key] = asyncio.ensure_future(self.build_and_store(key, code, spec))
+            artifact = await asyncio.shield(self.builds[key])
+        artifact.in_use += 1
+        return artifact
+
+    def release_artifact(self, artifact: Artifact) -> None:
+        artifact.in_use -= 1
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop least recently used artifacts beyond the cache size, skipping ones still being run."""
+        for key in list(self.artifacts):
+            if len(self.artifacts) <= self.artifact_cache_size:
+                break
+            artifact = self.artifacts[key]
+            if artifact.in_use:
+                continue
+            del self.artifacts[key]
+            if artifact.directory:
+                shutil.rmtree(artifact.directory, ignore_errors=True)
+
+    def run(self, spec: LanguageSpec, artifact_directory: str, stdin: str, on_start: Optional[Callable[[int], None]] = None) -> CodeExecutionResult:
+        """Run a built program against one input in its own scratch directory. Blocks the calling thread."""
+        workdir = tempfile.mkdtemp(prefix="codecraft-run-", dir=SANDBOX_TMP_DIR)
+        try:
+            os.chown(workdir, SANDBOX_UID, SANDBOX_GID)
+            command = [part.replace("{artifact}", artifact_directory) for part in spec.run_command]
+            limits = build_limits(SANDBOX_CPU_TIME_LIMIT, SANDBOX_MEMORY_LIMIT_MB, spec.limit_address_space)
+            result = run_process(command, workdir, stdin, limits, SANDBOX_WALL_TIME_LIMIT, SANDBOX_UID, SANDBOX_GID, on_start=on_start, artifact=artifact_directory)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return CodeExecutionResult(
+            output=result.stdout,
+            stderror=result.stderr,
+            time=f"{result.cpu_time:.3f}",
+            memory=result.memory_kb,
+            compiler_errors='',
+            status="Accepted" if result.exit_code == 0 and not result.timed_out else describe_failure(result)
+        )
+
+    async def execute(self, code: str, language: str, stdin: Optional[str]) -> CodeExecutionResult:
+        spec = self.get_spec(language)
+        try:
+            artifact = await self.acquire_artifact(code, spec)
+        except Exception as e:
+            logger.error(f"Sandbox build error occurred: {e}")
+            return CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors='')
+
+        try:
+            if artifact.compile_error is not None:
+                return artifact.compile_error
+            loop = asyncio.get_running_loop()
+            pids: List[int] = []
+            try:
+                return await loop.run_in_executor(self.get_pool(), self.run, spec, artifact.directory, stdin or "", pids.append)
+            except asyncio.CancelledError:
+                # The worker thread cannot be interrupted, but killing the program lets it finish at once
+                for pid in pids:
+                    kill_group(pid)
+                raise
+        except Exception as e:
+            logger.error(f"Sandbox execution error occurred: {e}")
+            return CodeExecutionResult(output='', stderror='', time='0', memory='0', compiler_errors='')
+        finally:
+            self.release_artifact(artifact)
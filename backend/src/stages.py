@@ -0,0 +1,67 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from models import StageTiming
+
+# A stage receives the results of every stage finished so far, keyed by stage name
+StageFunction = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+@dataclass
+class Stage:
+    run: StageFunction
+    depends_on: Tuple[str, ...]
+
+class StageGraph:
+    """
+    Runs pipeline stages as soon as the stages they depend on have finished, so independent stages
+    overlap, and records when each stage started (relative to the graph) and how long it took.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Stage] = {}
+        self.timings: List[StageTiming] = []
+
+    def add(self, name: str, run: StageFunction, depends_on: Iterable[str] = ()) -> None:
+        self.stages[name] = Stage(run, tuple(depends_on))
+
+    async def timed(self, name: str, awaitable: Awaitable[Any]) -> Any:
+        """Await a single stage outside the graph, recording its timing."""
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings.append(StageTiming(
+                name=name,
+                start=round(start - self.started, 4),
+                duration=round(time.perf_counter() - start, 4)
+            ))
+
+    async def run(self) -> Dict[str, Any]:
+        """
+        Run every added stage and return their results by name.
+        The first stage to fail cancels the ones still running and its error is raised.
+        """
+        results: Dict[str, Any] = {}
+        waiting = dict(self.stages)
+        self.stages = {}
+        running: Dict[asyncio.Future, str] = {}
+        try:
+            while waiting or running:
+                for name, stage in list(waiting.items()):
+                    if all(dependency in results for dependency in stage.depends_on):
+                        running[asyncio.ensure_future(self.timed(name, stage.run(results)))] = name
+                        del waiting[name]
+                if not running:
+                    raise ValueError(f"Stages with unsatisfiable dependencies: {', '.join(waiting)}")
+
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[running.pop(task)] = task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        return results
@@ -89,11 +89,43 @@ const formSchema = z.object({
 // Define type based on schema
 type FormValues = z.infer<typeof formSchema>;
 
+function parseServerSentEvent(block: string) {
+  let event = "message"
+  const dataLines: string[] = []
+  for (const line of block.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim()
+    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trim())
+  }
+  return { event, data: dataLines.length ? JSON.parse(dataLines.join("\n")) : null }
+}
+
+function describeProgress(event: string, data: any): string | null {
+  switch (event) {
+    case "solution_reused":
+      return data.verified ? "Found a previous solution that passes the test cases" : "Found a previous solution"
+    case "test_cases":
+      return `Prepared ${data.test_cases.length} test cases`
+    case "token":
+      return `Iteration ${data.iteration}: generating code...`
+    case "chain_of_thought":
+      return `Iteration ${data.iteration}: running test cases...`
+    case "test_result":
+      return `Iteration ${data.iteration}: test case ${data.index + 1} ${data.result.skipped ? "skipped" : data.result.passed ? "passed" : "failed"}`
+    case "candidate":
+      return `Iteration ${data.iteration}: candidate ${data.index + 1} passed ${data.passed}/${data.total} test cases`
+    case "iteration":
+      return `Iteration ${data.iteration}: ${data.passed}/${data.total} test cases passed`
+    default:
+      return null
+  }
+}
+
 export function CodeGenerator() {
   const [isLoading, setIsLoading] = useState(false)
   const [results, setResults] = useState(null)
   const [language, setLanguage] = useState("python")
   const [error, setError] = useState("")
+  const [progress, setProgress] = useState("")
   const [apiKey, setApiKey] = useState("")
   const [isApiKeyModalOpen, setIsApiKeyModalOpen] = useState(false)
   const [showQuestionCode, setShowQuestionCode] = useState(false)
@@ -226,7 +258,7 @@ export function CodeGenerator() {
       setLanguage(values.language)
 
       const API_URL = process.env.NEXT_PUBLIC_API_URL;
-      const response = await fetch(`${API_URL}/run_pipeline`, {
+      const response = await fetch(`${API_URL}/run_pipeline/stream`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -234,17 +266,48 @@ export function CodeGenerator() {
         body: JSON.stringify(payload),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! Status: ${response.status}`);
       }
 
-      const data = await response.json();
-      setResults(data.result);
+      // Read server-sent events until the final result arrives
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary = buffer.indexOf("\n\n");
+        while (boundary !== -1) {
+          const { event, data } = parseServerSentEvent(buffer.slice(0, boundary));
+          buffer = buffer.slice(boundary + 2);
+          boundary = buffer.indexOf("\n\n");
+
+          if (event === "result") {
+            setResults(data.result);
+            finished = true;
+          } else if (event === "error") {
+            throw new Error(data.detail);
+          } else {
+            const message = describeProgress(event, data);
+            if (message) setProgress(message);
+          }
+        }
+      }
+
+      if (!finished) {
+        throw new Error("Stream ended before the pipeline finished");
+      }
     } catch (err) {
       console.error("Error generating code:", err)
       setError("Failed to generate code. Please try again.")
     } finally {
       setIsLoading(false)
+      setProgress("")
     }
   }
 
@@ -558,6 +621,10 @@ export function CodeGenerator() {
                 )}
               </Button>
 
+              {isLoading && progress && (
+                <p className="text-sm text-muted-foreground text-center">{progress}</p>
+              )}
+
               {error && (
                 <div className="p-4 bg-red-500/20 text-red-600 dark:text-red-400 rounded-md">
                   {error}